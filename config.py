@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 from dynaconf import Dynaconf, Validator
 
 settings = Dynaconf(
@@ -14,13 +16,112 @@ settings = Dynaconf(
         Validator("skip_existing", cast=bool, default=False),
         Validator("max_workers", cast=int, gt=0, default=5),
         Validator("max_search_pages", cast=int, gt=0, default=15),
+        Validator("books_concurrency", cast=int, gt=0, default=8),
         Validator("amazon.enable", cast=bool, default=False),
         Validator("amazon.max_review_pages", cast=int, gt=0, default=3),
+        Validator("amazon.refresh_reviews_url_days", cast=int, gt=0, default=30),
         Validator("retry.retry_queue_size", cast=int, gt=0, default=512),
         Validator("retry.max_retry_count", cast=int, gt=0, default=3),
         Validator("retry.backoff_factor", cast=int, gt=0, default=1),
+        Validator("http.backend", cast=str, default="httpx", is_in=["httpx", "aiohttp"]),
+        Validator("http.cache_path", cast=str, default=".cache/etags.json"),
+        Validator("http.cache_size", cast=int, gt=0, default=4096),
+        Validator("http.cache_max_mb", cast=int, gt=0, default=32),
+        Validator("http.cache_save_interval", cast=float, gt=0, default=60.0),
+        Validator("http.max_connections", cast=int, gt=0, default=100),
+        Validator("http.timeout", cast=float, gt=0, default=20.0),
+        Validator("http.connect_timeout", cast=float, gt=0, default=5.0),
     ]
 )
 
 # `envvar_prefix` = export envvars with `export DYNACONF_FOO=bar`.
 # `settings_files` = Load these files in the order.
+
+
+# Dynaconf walks its loaders and validators on every attribute access, so the
+# validated values are snapshotted once into plain frozen dataclasses below.
+# Prefer `CONFIG`; `settings` is kept importable for ad-hoc use but is deprecated.
+
+@dataclass(frozen=True, slots=True)
+class RetryConfig:
+    retry_queue_size: int
+    max_retry_count: int
+    backoff_factor: int
+
+
+@dataclass(frozen=True, slots=True)
+class AmazonConfig:
+    enable: bool
+    max_review_pages: int
+    refresh_reviews_url_days: int
+
+
+@dataclass(frozen=True, slots=True)
+class HttpConfig:
+    backend: str
+    cache_path: str
+    cache_size: int
+    cache_max_mb: int
+    cache_save_interval: float
+    max_connections: int
+    timeout: float
+    connect_timeout: float
+
+
+@dataclass(frozen=True, slots=True)
+class AppConfig:
+    email: str
+    password: str
+    browser_user_data: str
+    headless: bool
+    search_keywords: tuple[str, ...]
+    unwanted_title_keywords: tuple[str, ...]
+    save_filename: str
+    skip_existing: bool
+    max_workers: int
+    max_search_pages: int
+    books_concurrency: int
+    retry: RetryConfig
+    amazon: AmazonConfig
+    http: HttpConfig
+
+
+def load_config(s: Dynaconf = settings) -> AppConfig:
+    """Validate the Dynaconf settings and freeze them into an `AppConfig`."""
+    s.validators.validate()
+    return AppConfig(
+        email=s.email,
+        password=s.password,
+        browser_user_data=s.browser_user_data,
+        headless=s.headless,
+        search_keywords=tuple(s.search_keywords),
+        unwanted_title_keywords=tuple(s.unwanted_title_keywords),
+        save_filename=s.save_filename,
+        skip_existing=s.skip_existing,
+        max_workers=s.max_workers,
+        max_search_pages=s.max_search_pages,
+        books_concurrency=s.books_concurrency,
+        retry=RetryConfig(
+            retry_queue_size=s.retry.retry_queue_size,
+            max_retry_count=s.retry.max_retry_count,
+            backoff_factor=s.retry.backoff_factor,
+        ),
+        amazon=AmazonConfig(
+            enable=s.amazon.enable,
+            max_review_pages=s.amazon.max_review_pages,
+            refresh_reviews_url_days=s.amazon.refresh_reviews_url_days,
+        ),
+        http=HttpConfig(
+            backend=s.http.backend,
+            cache_path=s.http.cache_path,
+            cache_size=s.http.cache_size,
+            cache_max_mb=s.http.cache_max_mb,
+            cache_save_interval=s.http.cache_save_interval,
+            max_connections=s.http.max_connections,
+            timeout=s.http.timeout,
+            connect_timeout=s.http.connect_timeout,
+        ),
+    )
+
+
+CONFIG = load_config()
@@ -1,7 +1,7 @@
 import asyncio
-from config import settings
+from config import CONFIG
 from utils.scraper import BookmeterScraper
 
 if __name__ == "__main__":
-    scraper = BookmeterScraper(settings=settings)
+    scraper = BookmeterScraper(settings=CONFIG)
     asyncio.run(scraper.run())
@@ -0,0 +1,37 @@
+import os
+import unittest
+from unittest import mock
+
+from utils.httpclient import DEFAULT_LIMITS, HttpClientAsync
+
+
+class ProxyMountsTest(unittest.TestCase):
+    """The explicit transport has to map the proxy environment the way httpx itself would."""
+
+    def _mounts(self, **env: str) -> dict:
+        with mock.patch.dict(os.environ, env, clear=True):
+            return HttpClientAsync._proxy_mounts(DEFAULT_LIMITS)
+
+    def test_no_proxy(self):
+        mounts = self._mounts(HTTP_PROXY="http://127.0.0.1:3128", NO_PROXY="localhost,127.0.0.1,::1,.example.com")
+        self.assertIsNotNone(mounts.pop("http://"))
+        self.assertEqual(mounts, {
+            "all://localhost": None,
+            "all://127.0.0.1": None,
+            "all://[::1]": None,
+            "all://*.example.com": None,
+        })
+
+    def test_no_proxy_wildcard(self):
+        self.assertEqual(self._mounts(HTTPS_PROXY="127.0.0.1:3128", NO_PROXY="*"), {})
+
+    def test_no_proxy_without_proxy(self):
+        self.assertEqual(self._mounts(NO_PROXY="localhost,::1"), {})
+
+    def test_client_builds(self):
+        with mock.patch.dict(os.environ, {"HTTP_PROXY": "http://127.0.0.1:3128", "NO_PROXY": "localhost,::1"}, clear=True):
+            HttpClientAsync()
+
+
+if __name__ == "__main__":
+    unittest.main()
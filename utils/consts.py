@@ -1,6 +1,10 @@
+from functools import lru_cache
 from urllib.parse import quote
 
+import httpx
+
 URL = 'https://bookmeter.com'
+AMAZON_URL = 'https://www.amazon.co.jp'
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36",
     "Accept-Language": "en-US,en;q=0.9",
@@ -12,6 +16,9 @@ HEADERS = {
     "Referer": "https://www.google.com",
     "Cache-Control": "max-age=0",
 }
+# Normalised once for httpx. Connection is dropped: implicit in HTTP/1.1, forbidden in HTTP/2.
+HEADERS_HTTPX = httpx.Headers({k: v for k, v in HEADERS.items() if k.lower() != "connection"})
+MAX_BACKOFF = 60.0  # seconds, upper bound for any single retry delay
 PLAYWRIGHT_ARGS = [
     "--js-flags=--max_old_space_size=512",
     "--disable-dev-shm-usage",
@@ -21,19 +28,49 @@ PLAYWRIGHT_ARGS = [
     "--mute-audio",
     "--blink-settings=imagesEnabled=false",  # Don't load images
 ]
+# Requests the scraper never needs: aborted by the browser context's route handler.
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+BLOCKED_URL_PARTS = ("googletagmanager", "google-analytics", "doubleclick", "amazon-adsystem", "facebook.net")
+# Subresources (scripts, XHR) are only fetched from these hosts and their subdomains.
+ALLOWED_HOSTS = ("bookmeter.com", "amazon.co.jp", "media-amazon.com", "ssl-images-amazon.com")
+
+# URL templates are built once; only the per-call values are formatted in.
+_AUTHOR_TMPL = URL + '/api/v1/books/{book_id}/related_books/author?limit={limit}'
+_REVIEW_TMPL = URL + '/books/{book_id}/reviews.json?offset={offset}&limit={limit}'
+_SEARCH_TMPL = URL + '/search?author=&keyword={kw}&sort=release_date&type=japanese_v2&page={page}'
+_SEARCH_TMPL_PARTIAL = _SEARCH_TMPL + '&partial=true'
+_EXTERNAL_STORES_TMPL = URL + '/api/v1/books/{book_id}/external_book_stores.json?'
+_AMAZON_REVIEWS_TMPL = AMAZON_URL + '/product-reviews/{asin}/'
+_AMAZON_REVIEWS_AJAX_TMPL = AMAZON_URL + '/hz/reviews-render/ajax/reviews/get/ref=cm_cr_getr_d_paging_btm_next_{page}'
+
+
+@lru_cache(maxsize=4096)
+def _quote_kw(keyword: str) -> str:
+    return quote(keyword)
+
 
 def author_url(book_id: str | int, limit: int = 8):
-    return f'{URL}/api/v1/books/{book_id}/related_books/author?limit={limit}'
+    return _AUTHOR_TMPL.format(book_id=book_id, limit=limit)
 
 
 def review_url(book_id: str | int, offset: int = 0, limit: int = 100):
-    return f'{URL}/books/{book_id}/reviews.json?offset={offset}&limit={limit}'
+    return _REVIEW_TMPL.format(book_id=book_id, offset=offset, limit=limit)
 
 
 def search_url(keyword: str, page: int = 1, partial: bool = True):
-    encoded_keyword = quote(keyword)
-    return f'{URL}/search?author=&keyword={encoded_keyword}&sort=release_date&type=japanese_v2&page={page}' + (
-        '&partial=true' if partial else '')
+    return (_SEARCH_TMPL_PARTIAL if partial else _SEARCH_TMPL).format(kw=_quote_kw(keyword), page=page)
+
 
 def external_stores_url(book_id: str | int):
-    return f'{URL}/api/v1/books/{book_id}/external_book_stores.json?'
\ No newline at end of file
+    return _EXTERNAL_STORES_TMPL.format(book_id=book_id)
+
+
+def amazon_reviews_url(asin: str):
+    """Canonical review list URL of a product, free of tracking parameters and ref paths."""
+    return _AMAZON_REVIEWS_TMPL.format(asin=asin)
+
+
+# unlike the per-book URLs (each book id is fetched once), the same few page numbers recur for every book
+@lru_cache(maxsize=64)
+def amazon_reviews_ajax_url(page: int):
+    return _AMAZON_REVIEWS_AJAX_TMPL.format(page=page)
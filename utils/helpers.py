@@ -1,46 +1,174 @@
-from collections import deque, namedtuple
+import asyncio
+import heapq
+import itertools
+import queue
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+from utils.consts import MAX_BACKOFF
 
 
 def keep_first_last_curly_brackets(text: str) -> str:
-    """Return substring from the first "{" to the last "}" (both inclusive)."""
+    """Return substring from the first "{" to the last "}" (both inclusive), "" if there is no such pair."""
 
     left, right = text.find("{"), text.rfind("}")
-    return text[left: right + 1] if left != -1 and right != -1 else text
+    return text[left: right + 1] if -1 < left < right else ""
+
+
+def keep_first_last_curly_brackets_bytes(buf: bytes) -> bytes:
+    """Bytes flavour of `keep_first_last_curly_brackets`, so raw bodies are trimmed before any decode."""
+
+    left, right = buf.find(b"{"), buf.rfind(b"}")
+    return buf[left: right + 1] if -1 < left < right else b""
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: Optional[str], default: str = "1970-01-01T00:00:00.000+09:00") -> datetime:
+    """Parse an ISO-8601 timestamp into an aware UTC datetime; many books share a date, hence the cache.
 
+    Bookmeter always sends ISO-8601 (which `fromisoformat` fully covers since 3.11), so anything
+    else is treated like a missing value and yields `default`.
+    """
 
-RetryItem = namedtuple('RetryItem', ['id', 'attempts'])
+    try:
+        dt = datetime.fromisoformat(value or default)
+    except ValueError:
+        dt = datetime.fromisoformat(default)
+    return dt.astimezone(timezone.utc)
 
 
-class RetryQueue:
+@dataclass(slots=True, frozen=True)
+class RetryItem:
+    id: int
+    attempts: int
+
+
+class _RetryPolicy:
+    """Shared back-off/limit rules of the retry queues."""
+
+    def __init__(self, max_retry_count: int = 3, backoff_factor: int = 1):
+        self.max_retry_count = max_retry_count
+        self.backoff_factor = backoff_factor
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential back-off, so concurrent retries don't hit the host in lockstep."""
+        return random.uniform(0, min(self.backoff_factor * (2 ** (attempt - 1)), MAX_BACKOFF))
+
+    def can_retry(self, attempt: int) -> bool:
+        return attempt < self.max_retry_count
+
+
+class RetryQueue(_RetryPolicy):
+    """Bounded FIFO retry queue on a preallocated ring buffer.
+
+    A full queue rejects new items with `queue.Full` rather than silently evicting the
+    oldest retry (which is what `deque(maxlen=...)` did); callers decide what to drop.
+    """
+
     def __init__(self,
                  max_size: int = 512,
                  max_retry_count: int = 3,
                  backoff_factor: int = 1):
+        super().__init__(max_retry_count, backoff_factor)
         self.max_size = max_size
-        self.max_retry_count = max_retry_count
-        self.backoff_factor = backoff_factor
 
-        self.queue = deque[RetryItem](maxlen=self.max_size)
+        self._buf: list[Optional[RetryItem]] = [None] * self.max_size
+        self._head = 0  # next slot to read
+        self._size = 0
 
     def enqueue(self, item: RetryItem) -> None:
-        self.queue.append(item)
+        if self._size == self.max_size:
+            raise queue.Full(f"retry queue is full ({self.max_size} items)")
+        self._buf[(self._head + self._size) % self.max_size] = item
+        self._size += 1
 
     def dequeue(self) -> RetryItem:
-        return self.queue.popleft()
+        if self._size == 0:
+            raise queue.Empty("retry queue is empty")
+        item, self._buf[self._head] = self._buf[self._head], None  # drop the reference
+        self._head = (self._head + 1) % self.max_size
+        self._size -= 1
+        return item
 
     def is_empty(self) -> bool:
-        return len(self.queue) == 0
+        return self._size == 0
 
-    def backoff(self, attempt: int) -> int:
-        return self.backoff_factor * (2 ** (attempt - 1))
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self):
+        return (f"RetryQueue(max_size={self.max_size}, "
+                f"max_retry_count={self.max_retry_count}, "
+                f"backoff_factor={self.backoff_factor})")
 
-    def can_retry(self, attempt: int) -> bool:
-        return attempt < self.max_retry_count
+
+class AsyncRetryQueue(_RetryPolicy):
+    """Retry queue ordered by ready time: each item waits out its back-off inside the queue,
+    so consumers only ever sleep until the earliest retry is due instead of per item.
+
+    Items stay in the heap until due, and every enqueue wakes the waiting consumers, so a retry
+    that becomes due sooner than the one they were waiting for is picked up right away."""
+
+    def __init__(self,
+                 max_size: int = 512,
+                 max_retry_count: int = 3,
+                 backoff_factor: int = 1):
+        super().__init__(max_retry_count, backoff_factor)
+        self.max_size = max_size
+
+        self._heap: list[tuple[float, int, RetryItem]] = []
+        self._seq = itertools.count()  # tie-breaker, RetryItems themselves are never compared
+        self._changed = asyncio.Event()  # set on every enqueue
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def enqueue(self, item: RetryItem) -> None:
+        """Schedule `item` after its jittered back-off; raises `asyncio.QueueFull` at capacity."""
+        if len(self._heap) >= self.max_size:
+            raise asyncio.QueueFull
+        ready = asyncio.get_running_loop().time() + self.backoff(item.attempts)
+        heapq.heappush(self._heap, (ready, next(self._seq), item))
+        self._unfinished += 1
+        self._finished.clear()
+        self._changed.set()
+
+    async def dequeue(self) -> RetryItem:
+        """Wait for the earliest item to become due and take it."""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._heap[0][0] - loop.time() if self._heap else None
+            if delay is not None and delay <= 0:
+                return heapq.heappop(self._heap)[2]
+            self._changed.clear()
+            try:
+                async with asyncio.timeout(delay):
+                    await self._changed.wait()
+            except TimeoutError:
+                pass
+
+    def task_done(self) -> None:
+        """Mark a dequeued item as handled (re-enqueue any follow-up retry first)."""
+        if self._unfinished <= 0:
+            raise ValueError("task_done() called too many times")
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self) -> None:
+        """Wait until every enqueued item has been dequeued and marked done."""
+        await self._finished.wait()
+
+    def is_empty(self) -> bool:
+        return not self._heap
 
     def __len__(self) -> int:
-        return len(self.queue)
+        return len(self._heap)
 
     def __repr__(self):
-        return (f"RetryQueue(max_size={self.max_size}, "
+        return (f"AsyncRetryQueue(max_size={self.max_size}, "
                 f"max_retry_count={self.max_retry_count}, "
                 f"backoff_factor={self.backoff_factor})")
@@ -0,0 +1,152 @@
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Any
+
+import httpx
+import orjson
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ConditionalCache:
+    """Bounded LRU of response validators (ETag / Last-Modified) and already-decoded bodies.
+
+    Entries are keyed by the caller (e.g. "json:<url>") and can be persisted to a JSON file,
+    so revalidation keeps paying off across runs. Responses with `Cache-Control: max-age`
+    are served without any request until they go stale.
+
+    The LRU is capped both by entry count and by the total size of the cached bodies, and
+    the file is rewritten every `save_interval` seconds of stores, not only on `save()`.
+    """
+
+    def __init__(
+            self,
+            path: Optional[str | Path] = None,
+            max_entries: int = 4096,
+            max_bytes: int = 32 * 1024 * 1024,
+            save_interval: float = 60.0,
+    ):
+        self._path = Path(path) if path else None
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._save_interval = save_interval
+        # key -> [etag, last_modified, value, fresh_until (epoch seconds, 0 = always revalidate), size (bytes)]
+        self._entries: OrderedDict[str, list[Any]] = OrderedDict()
+        self._bytes = 0
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def load(self) -> None:
+        if not self._path or not self._path.exists():
+            return
+        try:
+            for key, entry in orjson.loads(self._path.read_bytes()).items():
+                if len(entry) < 4:  # files written before fresh_until
+                    entry = entry + [0.0] * (4 - len(entry))
+                if len(entry) < 5:  # ... and before size
+                    entry.append(len(orjson.dumps(entry[2])))
+                self._entries[key] = entry
+                self._bytes += entry[4]
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable HTTP cache %s (%s)", self._path, e)
+        self._evict()
+
+    def save(self) -> None:
+        if not self._path:
+            return
+        # a failed save must not fail the request that triggered it; the next try is an interval away
+        self._saved_at = time.monotonic()
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._path.with_suffix(self._path.suffix + ".tmp")
+            tmp.write_bytes(orjson.dumps(self._entries))
+            tmp.replace(self._path)
+        except OSError as e:
+            logger.warning("Could not save HTTP cache %s (%s)", self._path, e)
+            return
+        self._dirty = False
+
+    def validators(self, key: str) -> dict[str, str]:
+        """Conditional request headers for `key`, empty if nothing is cached."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        etag, last_modified = entry[0], entry[1]
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def fresh(self, key: str) -> bool:
+        """Whether `key` may be served without contacting the origin."""
+        entry = self._entries.get(key)
+        return entry is not None and entry[3] > time.time()
+
+    def get(self, key: str) -> Any:
+        """Cached value for `key`; raises KeyError if absent."""
+        self._entries.move_to_end(key)
+        return self._entries[key][2]
+
+    def store(self, key: str, headers: httpx.Headers, value: Any, size: int) -> None:
+        """Cache `value` (decoded from a `size`-byte body) under `key`, if `headers` allow it."""
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        max_age = self._max_age(headers)
+        self._discard(key)
+        if max_age is None or (not etag and not last_modified and max_age == 0) or size > self._max_bytes // 8:
+            return  # uncacheable, or so big it would crowd out everything else
+        self._entries[key] = [etag, last_modified, value, time.time() + max_age if max_age else 0.0, size]
+        self._bytes += size
+        self._evict()
+        self._dirty = True
+        if self._path and time.monotonic() - self._saved_at >= self._save_interval:
+            self.save()
+
+    def revalidated(self, key: str, headers: httpx.Headers) -> Any:
+        """Record a 304 for `key` (new validators / freshness) and return the cached value."""
+        etag, last_modified, value, _, size = self._entries[key]
+        merged = httpx.Headers({k: v for k, v in (("ETag", etag), ("Last-Modified", last_modified)) if v})
+        merged.update(headers)
+        self.store(key, merged, value, size)
+        return value
+
+    def _discard(self, key: str) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._bytes -= entry[4]
+            self._dirty = True
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self._max_entries or self._bytes > self._max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[4]
+
+    @staticmethod
+    def _max_age(headers: httpx.Headers) -> Optional[int]:
+        """Seconds the response stays fresh, 0 if it must be revalidated, None if it must not be stored."""
+        directives = {}
+        for part in headers.get("Cache-Control", "").lower().split(","):
+            name, _, arg = part.strip().partition("=")
+            directives[name] = arg.strip('"')
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0
+        try:
+            return max(int(directives.get("s-maxage") or directives.get("max-age") or 0), 0)
+        except ValueError:
+            return 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def dirty(self) -> bool:
+        """Whether there are changes since the last `save()`."""
+        return self._dirty
@@ -1,53 +1,170 @@
 import asyncio
+import ipaddress
 import random
+import urllib.request
 from time import sleep
-from typing import Optional, Dict, Any, Self
+from typing import Optional, Dict, Any, Self, Literal, Callable, Awaitable, TypeVar, Iterable, Mapping
 
 import httpx
-import requests
+import msgspec
+import orjson
 
+from utils.consts import HEADERS_HTTPX, MAX_BACKOFF
+from utils.httpcache import ConditionalCache
 
-class HttpClient:
-    """Tiny HTTP client with retries + exponential back‑off."""
+# Keep sockets around as long as nginx does (keepalive_timeout 75s) instead of httpx's 5s default.
+DEFAULT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=75.0)
+# Fail fast on unreachable hosts; the APIs answer well within the read budget.
+DEFAULT_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
 
-    def __init__(self, retries: int = 2, base_backoff: float = 1.0):
-        self._session = requests.Session()
+
+# Failures worth another attempt: bad status, network trouble, undecodable body (orjson/msgspec errors are ValueErrors).
+_RETRYABLE = (httpx.HTTPStatusError, httpx.TransportError, ValueError)
+# ... except these answers, which won't change by asking again with the same request
+_FINAL_STATUSES = frozenset({401, 403, 404, 410})
+
+T = TypeVar("T")
+
+
+class _RetryMixin:
+    """Retry/back‑off policy shared by the sync and async clients."""
+
+    _retries: int
+    _base_backoff: float
+
+    @staticmethod
+    def _retryable(exc: Exception) -> bool:
+        return not (isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in _FINAL_STATUSES)
+
+    @staticmethod
+    def _reason(exc: Exception) -> str:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return f"HTTP {exc.response.status_code}"
+        return f"{type(exc).__name__}: {exc}"
+
+    def _delay(self, attempt: int) -> float:
+        # full jitter: spread retries from concurrent callers instead of bunching them up
+        return random.uniform(0, min((2 ** attempt) * self._base_backoff, MAX_BACKOFF))
+
+
+class HttpClient(_RetryMixin):
+    """Tiny sync HTTP client with retries + exponential back‑off, configured like `HttpClientAsync`."""
+
+    def __init__(
+            self,
+            retries: int = 2,
+            base_backoff: float = 1.0,
+            limits: Optional[httpx.Limits] = None,
+            timeout: Optional[httpx.Timeout] = None,
+    ):
+        self._client = httpx.Client(
+            timeout=timeout or DEFAULT_TIMEOUT,
+            follow_redirects=True,
+            http2=True,
+            headers=HEADERS_HTTPX,
+            limits=limits or DEFAULT_LIMITS,
+        )
         self._retries = retries
         self._base_backoff = base_backoff
 
-    def get_json(self, url: str) -> dict:
-        response = {"status_code": -1}
+    def get_json(self, url: str) -> Dict[str, Any]:
+        return self._with_retry(url, lambda: orjson.loads(self._get(url).content))
+
+    def get_text(self, url: str) -> str:
+        return self._with_retry(url, lambda: self._get(url).text)
+
+    def close(self) -> None:
+        self._client.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> Optional[bool]:
+        self.close()
+        return None
+
+    def _get(self, url: str) -> httpx.Response:
+        return self._client.get(url).raise_for_status()
+
+    def _with_retry(self, url: str, fn: Callable[[], T]) -> T:
+        last_exc: Exception | None = None
         for attempt in range(self._retries + 1):
-            response = self._session.get(url, timeout=30)
-            if response.ok:
-                return response.json()
-            self._sleep(attempt)
-        raise RuntimeError(
-            f"Failed to fetch {url} after {self._retries} retries (final status {response.status_code})"
-        )
+            try:
+                return fn()
+            except msgspec.ValidationError:
+                raise  # a body that decodes but doesn't fit the expected type: a schema mismatch, not a glitch
+            except _RETRYABLE as e:
+                last_exc = e
+                if attempt == self._retries or not self._retryable(e):
+                    break
+                sleep(self._delay(attempt))
+        raise RuntimeError(f"Failed to fetch {url} after {attempt + 1} attempt(s): {self._reason(last_exc)}") from last_exc
 
-    def _sleep(self, attempt: int) -> None:
-        sleep((2 ** attempt) * self._base_backoff + random.random())
 
+class HttpClientAsync(_RetryMixin):
+    """Tiny async HTTP client with retries, exponential back‑off and a shared keep‑alive pool."""
 
-class HttpClientAsync:
-    """Tiny async HTTP client with retries and exponential back‑off."""
+    # connection-level retries inside the transport (refused/reset connects), before any back-off
+    CONNECT_RETRIES = 2
 
-    def __init__(self, retries: int = 2, base_backoff: float = 1.0) -> None:
-        self._client = httpx.AsyncClient(timeout=30.0, follow_redirects=True)
+    def __init__(
+            self,
+            retries: int = 2,
+            base_backoff: float = 1.0,
+            limits: Optional[httpx.Limits] = None,
+            backend: str = "httpx",
+            cache: Optional[ConditionalCache] = None,
+            timeout: Optional[httpx.Timeout] = None,
+    ) -> None:
+        limits = limits or DEFAULT_LIMITS
+        aiohttp = backend == "aiohttp"
+        self._client = httpx.AsyncClient(
+            timeout=timeout or DEFAULT_TIMEOUT,
+            follow_redirects=True,
+            http2=True,
+            headers=HEADERS_HTTPX,
+            limits=limits,
+            transport=self._aiohttp_transport(limits) if aiohttp else self._http_transport(limits),
+            # aiohttp reads the proxy environment itself (trust_env)
+            mounts=None if aiohttp else self._proxy_mounts(limits),
+        )
         self._retries = retries
         self._base_backoff = base_backoff
+        self._cache = cache
+        if self._cache is not None:
+            self._cache.load()
 
     # -------- public API -------- #
 
-    async def get_json(self, url: str) -> Dict[str, Any]:
-        return await self._request(url, expect_json=True)  # type: ignore[return-value]
+    async def get_json(self, url: str, type: Optional[type[T]] = None) -> T | Dict[str, Any]:
+        """Decoded JSON body; with `type` (e.g. a msgspec Struct) it is validated into that type in one pass."""
+        return await self._request(url, expect="json", type=type)
 
     async def get_text(self, url: str) -> str:
-        return await self._request(url, expect_json=False)  # type: ignore[return-value]
+        return await self._request(url, expect="text")  # type: ignore[return-value]
+
+    async def get_bytes(self, url: str) -> bytes:
+        """Raw response body, for callers that can work on bytes and skip the text decode."""
+        return await self._request(url, expect="bytes")  # type: ignore[return-value]
+
+    async def post_form(self, url: str, data: Mapping[str, str], headers: Optional[Mapping[str, str]] = None) -> str:
+        """POST a urlencoded form and return the response text (never cached)."""
+
+        async def post():
+            resp = await self._client.post(url, data=data, headers=headers)
+            return resp.raise_for_status().text
+
+        return await self._with_retry(url, post)
+
+    def set_cookies(self, cookies: Iterable[Mapping[str, Any]]) -> None:
+        """Adopt browser cookies (e.g. Playwright's `context.cookies()`) so requests share its session."""
+        for c in cookies:
+            self._client.cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"))
 
     async def aclose(self) -> None:
         await self._client.aclose()
+        if self._cache is not None and self._cache.dirty:
+            self._cache.save()
 
     # -------- context‑manager sugar -------- #
 
@@ -60,19 +177,107 @@ class HttpClientAsync:
 
     # -------- internals -------- #
 
-    async def _request(self, url: str, *, expect_json: bool):
+    async def _request(self, url: str, *, expect: Literal["json", "text", "bytes"], type: Optional[type] = None):
+        # raw bytes aren't JSON-serialisable, so only decoded bodies go through the conditional cache
+        cache = self._cache if expect != "bytes" else None
+        key = f"{expect}:{url}"
+
+        async def fetch():
+            resp = await self._client.get(url, headers=cache.validators(key) if cache is not None else None)
+            if resp.status_code == httpx.codes.NOT_MODIFIED and cache is not None and key in cache:
+                return self._typed(cache.revalidated(key, resp.headers), type)
+            resp.raise_for_status()
+            if expect == "json" and type is not None:
+                value = msgspec.json.decode(resp.content, type=type, strict=False)
+                if cache is not None:
+                    # the cache holds plain JSON values, shared with untyped callers of the same URL
+                    cache.store(key, resp.headers, msgspec.to_builtins(value), len(resp.content))
+                return value
+            if expect == "json":
+                value = orjson.loads(resp.content)
+            else:
+                value = resp.text if expect == "text" else resp.content
+            if cache is not None:
+                cache.store(key, resp.headers, value, len(resp.content))
+            return value
+
+        if cache is not None and cache.fresh(key):
+            return self._typed(cache.get(key), type)
+        return await self._with_retry(url, fetch)
+
+    @staticmethod
+    def _typed(value: Any, type: Optional[type]) -> Any:
+        return value if type is None else msgspec.convert(value, type, strict=False)
+
+    async def _with_retry(self, url: str, fn: Callable[[], Awaitable[T]]) -> T:
         last_exc: Exception | None = None
         for attempt in range(self._retries + 1):
             try:
-                resp = await self._client.get(url)
-                resp.raise_for_status()
-                return resp.json() if expect_json else resp.text
-            except (httpx.HTTPStatusError, httpx.TransportError, ValueError) as e:
+                return await fn()
+            except msgspec.ValidationError:
+                raise  # a body that decodes but doesn't fit the expected type: a schema mismatch, not a glitch
+            except _RETRYABLE as e:
                 last_exc = e
-                if attempt == self._retries:
+                if attempt == self._retries or not self._retryable(e):
                     break
-                await self._sleep(attempt)
-        raise RuntimeError(f"Failed to fetch {url} after {self._retries} retries") from last_exc
+                await asyncio.sleep(self._delay(attempt))
+        raise RuntimeError(f"Failed to fetch {url} after {attempt + 1} attempt(s): {self._reason(last_exc)}") from last_exc
+
+    @classmethod
+    def _http_transport(cls, limits: httpx.Limits, proxy: Optional[str] = None) -> httpx.AsyncHTTPTransport:
+        return httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=cls.CONNECT_RETRIES, proxy=proxy)
+
+    @classmethod
+    def _proxy_mounts(cls, limits: httpx.Limits) -> dict[str, Optional[httpx.AsyncBaseTransport]]:
+        """Transports for HTTP(S)_PROXY / ALL_PROXY / NO_PROXY.
+
+        httpx only reads the proxy environment when it builds the transport itself, so with an explicit
+        transport the same mapping has to be mounted by hand (None = connect directly).
+        """
+        proxies = urllib.request.getproxies()
+        no_proxy = [h.strip() for h in proxies.pop("no", "").split(",") if h.strip()]
+        if "*" in no_proxy:
+            return {}
+        mounts: dict[str, Optional[httpx.AsyncBaseTransport]] = {}
+        for scheme in ("http", "https", "all"):
+            if url := proxies.get(scheme):
+                mounts[f"{scheme}://"] = cls._http_transport(limits, url if "://" in url else f"http://{url}")
+        if mounts:
+            for host in no_proxy:
+                mounts[cls._no_proxy_pattern(host)] = None
+        return mounts
+
+    @staticmethod
+    def _no_proxy_pattern(host: str) -> str:
+        """Mount pattern for a NO_PROXY entry, by the same rules httpx applies to the environment."""
+        if "://" in host:
+            return host
+        address = host.split("/")[0]
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            # ".example.com" covers subdomains only, "example.com" the domain itself as well
+            return f"all://{host}" if host.lower() == "localhost" else f"all://*{host}"
+        return f"all://[{host}]" if ip.version == 6 else f"all://{host}"
+
+    @staticmethod
+    def _aiohttp_transport(limits: httpx.Limits) -> httpx.AsyncBaseTransport:
+        """Route requests through aiohttp, which copes better with high fan‑out (HTTP/1.1 only)."""
+        try:
+            import aiohttp
+            from httpx_aiohttp import AiohttpTransport
+        except ImportError as e:
+            raise ImportError("The aiohttp backend requires the 'aiohttp' extra: pip install httpx-aiohttp") from e
 
-    async def _sleep(self, attempt: int) -> None:
-        await asyncio.sleep((2 ** attempt) * self._base_backoff + random.random())
+        # The session must be created inside the running loop, so hand the transport a factory.
+        return AiohttpTransport(client=lambda: aiohttp.ClientSession(
+            trust_env=True,
+            connector=aiohttp.TCPConnector(
+                limit=limits.max_connections or 0,
+                limit_per_host=limits.max_keepalive_connections or 0,
+                keepalive_timeout=limits.keepalive_expiry,
+                enable_cleanup_closed=True,
+                use_dns_cache=True,
+                ttl_dns_cache=300,
+            ),
+        ))
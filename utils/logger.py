@@ -1,6 +1,8 @@
+import functools
 import logging
 import pathlib
 from datetime import datetime
+from logging.handlers import RotatingFileHandler
 
 
 class StdoutFormatter(logging.Formatter):
@@ -19,30 +21,37 @@ class StdoutFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format + reset
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._formatters = {level: logging.Formatter(fmt) for level, fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self._formatters.get(record.levelno) or self._formatters[logging.INFO]
         return formatter.format(record)
 
 
-def get_logger(name: str) -> logging.Logger:
-    log_dir = "logs"
-    log_filename = datetime.now().strftime("%Y%m%d%H%M%S")
-    log_full_filename = "{0}/{1}.log".format(log_dir, log_filename)
-    pathlib.Path(log_dir).mkdir(parents=True, exist_ok=True)
+# resolved once at import: one log file per run, shared by every module's logger
+_LOG_DIR = pathlib.Path("logs")
+_LOG_DIR.mkdir(parents=True, exist_ok=True)
+_LOG_FILE = _LOG_DIR / (datetime.now().strftime("%Y%m%d%H%M%S") + ".log")
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+_FILE_HANDLER = RotatingFileHandler(_LOG_FILE, maxBytes=64 * 1024 * 1024, backupCount=5, encoding="utf-8")
+_FILE_HANDLER.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+_FILE_HANDLER.setLevel(logging.DEBUG)
 
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(StdoutFormatter())
-    stream_handler.setLevel(logging.DEBUG)
+_STREAM_HANDLER = logging.StreamHandler()
+_STREAM_HANDLER.setFormatter(StdoutFormatter())
+_STREAM_HANDLER.setLevel(logging.DEBUG)
 
-    file_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    file_handler = logging.FileHandler(log_full_filename, encoding="utf-8")
-    file_handler.setFormatter(file_formatter)
-    file_handler.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
 
-    logger.addHandler(stream_handler)
+@functools.lru_cache(maxsize=None)
+def get_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.DEBUG)
+    # handlers live on every named logger, so don't also bubble up to parents ("utils" -> "utils.x")
+    logger.propagate = False
+    logger.addHandler(_FILE_HANDLER)
+    logger.addHandler(_STREAM_HANDLER)
     return logger
@@ -1,12 +1,14 @@
+import asyncio
 import sqlite3
 import threading
+from itertools import chain
 from abc import abstractmethod
+from time import sleep, time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Protocol
+from typing import Protocol, Iterable, Sequence, Optional
 
-from dateutil import parser
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from pymilvus import (
     FieldSchema, DataType, MilvusClient, CollectionSchema, Collection, )
 
@@ -27,6 +29,9 @@ class BookRepository(Protocol):
     @abstractmethod  # type: ignore[misc]
     def exists(self, book_id: int) -> bool: ...
 
+    @abstractmethod  # type: ignore[misc]
+    def existing_book_ids(self) -> set[int]: ...
+
     @abstractmethod  # type: ignore[misc]
     def books(self) -> list[Book]: ...
 
@@ -39,15 +44,37 @@ class BookRepository(Protocol):
     @abstractmethod  # type: ignore[misc]
     def save_book(self, book: Book) -> None: ...
 
+    @abstractmethod  # type: ignore[misc]
+    def save_many(self, books: Iterable[Book], source: str = "", *, reviews: Iterable[Review] = (),
+                  flush: bool = False) -> None: ...
+
     @abstractmethod  # type: ignore[misc]
     def save_reviews(self, reviews: list[Review]) -> None: ...
 
+    @abstractmethod  # type: ignore[misc]
+    def amazon_reviews_url(self, book_id: int, max_age_days: int) -> Optional[str]: ...
+
+    @abstractmethod  # type: ignore[misc]
+    def save_amazon_reviews_url(self, book_id: int, url: str) -> None: ...
+
+    @abstractmethod  # type: ignore[misc]
+    def flush(self) -> None: ...
+
     @abstractmethod  # type: ignore[misc]
     def destroy(self) -> None: ...
 
 
 class SQLiteRepository:
-    """Thread‑safe SQLite implementation (books + book_reviews)."""
+    """SQLite implementation (books + book_reviews), relying on SQLite's own write serialisation."""
+
+    # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints under WAL.
+    _PRAGMAS = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA cache_size = -65536;
+    """
 
     _DDL = """
     PRAGMA foreign_keys = ON;
@@ -70,16 +97,64 @@ class SQLiteRepository:
         FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
     );
     CREATE INDEX IF NOT EXISTS idx_reviews_book_id ON book_reviews(book_id);
+    -- Amazon product-reviews page per book, looked up before the book itself is saved (so no FK)
+    CREATE TABLE IF NOT EXISTS amazon_review_urls (
+        book_id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        resolved_at REAL NOT NULL
+    );
     """
 
-    def __init__(self, db_path: str):
+    # Statements are kept verbatim so sqlite3's statement cache reuses the compiled form.
+    _SQL_EXISTS = "SELECT 1 FROM books WHERE id = ?"
+    _SQL_BOOK_IDS = "SELECT id FROM books"
+    _SQL_BOOKS = "SELECT * FROM books"
+    _SQL_REVIEWS = "SELECT * FROM book_reviews"
+    # positional parameters, bound from tuples: slotted Books/Reviews have no __dict__ to bind by name
+    _SQL_UPSERT_BOOK = """
+        INSERT INTO books (id, title, author, url, published_at, image_url, page, registration_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO
+        UPDATE SET
+            title = excluded.title,
+            author = excluded.author,
+            url = excluded.url,
+            published_at = excluded.published_at,
+            image_url = excluded.image_url,
+            page = excluded.page,
+            registration_count = excluded.registration_count
+        """
+    _SQL_INSERT_REVIEW = """
+        INSERT
+        OR IGNORE INTO book_reviews (book_id, source, review)
+        VALUES (?, ?, ?)
+        """
+    _SQL_AMAZON_URL = "SELECT url FROM amazon_review_urls WHERE book_id = ? AND resolved_at >= ?"
+    _SQL_UPSERT_AMAZON_URL = """
+        INSERT INTO amazon_review_urls (book_id, url, resolved_at)
+        VALUES (?, ?, ?) ON CONFLICT(book_id) DO
+        UPDATE SET
+            url = excluded.url,
+            resolved_at = excluded.resolved_at
+        """
+
+    # "database is locked" retries: attempts and base delay (seconds), doubled per attempt
+    _LOCKED_RETRIES = 5
+    _LOCKED_BACKOFF = 0.05
+
+    def __init__(self, db_path: str, *, cache_ids: bool = True, flush_every: int = 5000):
         self._db_path = Path(db_path)
         self._conn = sqlite3.connect(db_path, check_same_thread=False)
         self._conn.row_factory = sqlite3.Row
-        self._lock = threading.Lock()
         with self._conn:
             # executescript allows running multiple statements at once
-            self._conn.executescript(self._DDL)
+            self._conn.executescript(self._PRAGMAS + self._DDL)
+        # ids of stored books, so exists() is a set lookup; pass cache_ids=False to query instead
+        self._id_cache: set[int] | None = (
+            {row[0] for row in self._conn.execute(self._SQL_BOOK_IDS)} if cache_ids else None
+        )
+        # reviews are buffered and written in one transaction per `flush_every` rows (or on flush())
+        self._pending_reviews: list[Review] = []
+        self._flush_every = flush_every
 
     # ----------------------- context‑manager -------------------------
 
@@ -87,67 +162,129 @@ class SQLiteRepository:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._conn.close()
+        try:
+            self.flush()
+        finally:
+            self._conn.close()
 
     # ---------------------------- API -------------------------------
 
     def exists(self, book_id: int) -> bool:
-        with self._lock, self._conn as c:
-            row = c.execute("SELECT 1 FROM books WHERE id = ?",
-                            (book_id,)).fetchone()
-            return row is not None
+        if self._id_cache is not None:
+            return book_id in self._id_cache
+        row = self._conn.execute(self._SQL_EXISTS, (book_id,)).fetchone()
+        return row is not None
+
+    def existing_book_ids(self) -> set[int]:
+        """Ids of every stored book."""
+        if self._id_cache is not None:
+            return set(self._id_cache)
+        return {row[0] for row in self._conn.execute(self._SQL_BOOK_IDS)}
 
     def books(self) -> list[Book]:
-        with self._lock, self._conn as c:
-            rows = c.execute("SELECT * FROM books").fetchall()
-            return [Book(**row) for row in rows]
+        rows = self._conn.execute(self._SQL_BOOKS).fetchall()
+        return [Book(**row, reviews=[]) for row in rows]
 
     def reviews(self) -> list[Review]:
-        with self._lock, self._conn as c:
-            rows = c.execute("SELECT * FROM book_reviews").fetchall()
-            return [Review(**row) for row in rows]
+        self.flush()
+        rows = self._conn.execute(self._SQL_REVIEWS).fetchall()
+        return [Review(book_id=row["book_id"], review=row["review"], source=row["source"]) for row in rows]
 
     def save(self, book: Book, source: str = "bookmeter"):
-        self.save_book(book)
-        self.save_reviews(
-            [Review(book_id=book.id, review=r, source=source) for r in book.reviews])
+        """Add a Book and buffer its reviews; a due review batch shares the book's transaction"""
+        self._write((book,), [Review(book_id=book.id, review=r, source=source) for r in book.reviews])
 
     def save_book(self, book: Book) -> None:
         """Add a Book without reviews"""
-        with self._lock, self._conn:
-            self._conn.execute(
-                """
-                INSERT INTO books (id, title, author, url, published_at, image_url, page, registration_count)
-                VALUES (:id, :title, :author, :url, :published_at, :image_url, :page,
-                        :registration_count) ON CONFLICT(id) DO
-                UPDATE SET
-                    title = excluded.title,
-                    author = excluded.author,
-                    url = excluded.url,
-                    published_at = excluded.published_at,
-                    image_url = excluded.image_url,
-                    page = excluded.page,
-                    registration_count = excluded.registration_count
-                """,
-                book.__dict__,
-            )
+        self._write((book,))
+
+    def save_many(self, books: Iterable[Book], source: str = "bookmeter", *, reviews: Iterable[Review] = (),
+                  flush: bool = False) -> None:
+        """Add several Books in one transaction and buffer their reviews and `reviews` (e.g. from other
+        sources), see `save`; with `flush` every buffered review is written in that same transaction"""
+        books = list(books)
+        if not books:
+            return
+        own = [Review(book_id=b.id, review=r, source=source) for b in books for r in b.reviews]
+        self._write(books, own + list(reviews), flush=flush)
 
     def save_reviews(self, reviews: list[Review]) -> None:
-        """Write reviews in batch, de-duped by UNIQUE(book_id, source, review)"""
+        """Buffer reviews, written in batch and de-duped by UNIQUE(book_id, source, review)"""
         if len(reviews) == 0:
             return
-        with self._lock, self._conn:
-            self._conn.executemany(
-                """
-                INSERT
-                OR IGNORE INTO book_reviews (book_id, source, review)
-                VALUES (:book_id, :source, :review)
-                """,
-                (r.__dict__ for r in reviews),
-            )
+        self._write(reviews=reviews)
+
+    def amazon_reviews_url(self, book_id: int, max_age_days: int) -> Optional[str]:
+        """The Amazon reviews URL recorded for `book_id` within the last `max_age_days` days"""
+        row = self._conn.execute(self._SQL_AMAZON_URL, (book_id, time() - max_age_days * 86400)).fetchone()
+        return row[0] if row else None
+
+    def save_amazon_reviews_url(self, book_id: int, url: str) -> None:
+        with self._conn as c:
+            c.execute(self._SQL_UPSERT_AMAZON_URL, (book_id, url, time()))
+
+    def flush(self) -> None:
+        """Write all buffered reviews in a single transaction"""
+        if self._pending_reviews:
+            self._write(flush=True)
 
     def destroy(self) -> None:
         self._db_path.unlink()
+        self._pending_reviews.clear()
+        if self._id_cache is not None:
+            self._id_cache.clear()
+
+    # --------------------------- helpers ----------------------------
+
+    def _write(self, books: Sequence[Book] = (), reviews: Sequence[Review] = (), *, flush: bool = False) -> None:
+        """Upsert `books` and, once a batch is due (or on `flush`), insert the pending reviews plus
+        `reviews` in one transaction; otherwise `reviews` join the buffer after the books are committed.
+
+        There is no Python-side lock: sqlite serialises writers itself and WAL keeps readers
+        unblocked. A writer that still hits "database is locked" is retried with back-off.
+        """
+        flush = flush or len(self._pending_reviews) + len(reviews) >= self._flush_every
+        try:
+            for attempt in range(self._LOCKED_RETRIES):
+                try:
+                    with self._conn as c:
+                        if books:
+                            c.executemany(self._SQL_UPSERT_BOOK, (
+                                (b.id, b.title, b.author, b.url, b.published_at, b.image_url, b.page,
+                                 b.registration_count)
+                                for b in books
+                            ))
+                        if flush:
+                            c.executemany(self._SQL_INSERT_REVIEW, (
+                                (r.book_id, r.source, r.review) for r in chain(self._pending_reviews, reviews)
+                            ))
+                    break
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) or attempt == self._LOCKED_RETRIES - 1:
+                        raise
+                    logger.warning("SQLite is locked, retrying write (attempt %d)", attempt + 1)
+                    sleep(self._LOCKED_BACKOFF * (2 ** attempt))
+        except sqlite3.IntegrityError:
+            # reviews of a book that was never stored would fail this and every later flush: drop them
+            orphans = self._orphans(books, reviews) if flush else set()
+            if not orphans:
+                raise
+            logger.warning("Dropping buffered reviews of unknown book(s): %s", sorted(orphans))
+            self._pending_reviews = [r for r in self._pending_reviews if r.book_id not in orphans]
+            self._write(books, [r for r in reviews if r.book_id not in orphans], flush=True)
+            return
+        # only after the commit succeeded, so nothing is dropped, claimed or left without its book on failure
+        if flush:
+            self._pending_reviews.clear()
+        else:
+            self._pending_reviews.extend(reviews)
+        if self._id_cache is not None:
+            self._id_cache.update(b.id for b in books)
+
+    def _orphans(self, books: Sequence[Book], reviews: Sequence[Review]) -> set[int]:
+        """Book ids referenced by the pending reviews or `reviews` that are neither stored nor in `books`."""
+        ids = {r.book_id for r in chain(self._pending_reviews, reviews)} - {b.id for b in books}
+        return {i for i in ids if self._conn.execute(self._SQL_EXISTS, (i,)).fetchone() is None}
 
 
 class MilvusRepository:
@@ -161,6 +298,12 @@ class MilvusRepository:
     TITLE_VEC_DIM = 512
     REVIEW_VEC_DIM = 1536
 
+    # —— embeddings —— #
+    EMBED_MODEL = "text-embedding-3-small"
+    EMBED_BATCH_SIZE = 256  # inputs per embeddings request (API limit is 2048)
+    EMBED_CONCURRENCY = 8  # in-flight embeddings requests during migration
+    INSERT_BATCH_SIZE = 1000  # rows per Milvus insert/upsert during migration
+
     # —— schema —— #
     _books_fields = [
         FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
@@ -189,6 +332,7 @@ class MilvusRepository:
             openai_api_key: str,
     ):
         self._milvus_client = MilvusClient(uri=milvus_uri, token=milvus_token)
+        self._openai_api_key = openai_api_key
         self._openai_client = OpenAI(api_key=openai_api_key)
         self._lock = threading.Lock()
 
@@ -232,12 +376,16 @@ class MilvusRepository:
 
     def _embed_text(self, text: str, *, dim: int = 1536) -> list[float]:
         """Embed text using OpenAI's API"""
+        return self._embed_texts([text], dim=dim)[0]
+
+    def _embed_texts(self, texts: list[str], *, dim: int = 1536) -> list[list[float]]:
+        """Embed several texts with a single OpenAI request, preserving input order"""
         resp = self._openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text,
+            model=self.EMBED_MODEL,
+            input=texts,
             dimensions=dim  # clip dimensions
         )
-        return resp.data[0].embedding
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
 
     # -------------------- BookRepository 接口 ---------------------- #
     def exists(self, book_id: int) -> bool:
@@ -245,6 +393,11 @@ class MilvusRepository:
         res = self._books.query(expr, output_fields=["id"], limit=1)
         return len(res) > 0
 
+    def existing_book_ids(self) -> set[int]:
+        # through the client: self._books is the describe_collection() dict, not a Collection
+        res = self._milvus_client.query(collection_name=self.BOOKS_COL, filter="id != 0", output_fields=["id"])
+        return {row["id"] for row in res}
+
     def books(self) -> list[Book]:
         expr = "id != 0"
         res = self._books.query(expr,
@@ -268,8 +421,9 @@ class MilvusRepository:
         )
 
     def save_book(self, book: Book) -> None:
+        # the embedding round-trip dominates, keep it out of the critical section
+        title_vec = self._embed_text(book.title, dim=self.TITLE_VEC_DIM)
         with self._lock:
-            title_vec = self._embed_text(book.title, dim=self.TITLE_VEC_DIM)
             self._books.upsert([
                 [book.id],
                 title_vec,
@@ -282,30 +436,133 @@ class MilvusRepository:
                 [book.registration_count],
             ])
 
+    def save_many(self, books: Iterable[Book], source: str = "bookmeter", *, reviews: Iterable[Review] = (),
+                  flush: bool = False) -> None:
+        """Upsert several books with one title-embedding request, then their reviews and `reviews`
+
+        Milvus has no transactions and doesn't buffer, so `flush` changes nothing here.
+        """
+        books = list(books)
+        if not books:
+            return
+        rows = []
+        for start in range(0, len(books), self.EMBED_BATCH_SIZE):
+            chunk = books[start:start + self.EMBED_BATCH_SIZE]
+            vectors = self._embed_texts([b.title for b in chunk], dim=self.TITLE_VEC_DIM)
+            rows.extend(
+                {"id": b.id,
+                 "title": b.title,
+                 "title_vec": vec,
+                 "author": b.author,
+                 "url": b.url,
+                 "published_at_ts": self._epoch(b.published_at),
+                 "image_url": b.image_url,
+                 "page": b.page,
+                 "registration_count": b.registration_count}
+                for b, vec in zip(chunk, vectors)
+            )
+        with self._lock:
+            self._milvus_client.upsert(collection_name=self.BOOKS_COL, data=rows)
+        self.save_reviews([Review(book_id=b.id, review=r, source=source) for b in books for r in b.reviews]
+                          + list(reviews))
+
     def save_reviews(self, reviews: list[Review]) -> None:
         if not reviews:
             return
 
-        with self._lock:
-            rows = [
+        batches = []
+        for start in range(0, len(reviews), self.EMBED_BATCH_SIZE):
+            chunk = reviews[start:start + self.EMBED_BATCH_SIZE]
+            vectors = self._embed_texts([r.review for r in chunk], dim=self.REVIEW_VEC_DIM)
+            batches.append([
                 {"book_id": r.book_id,
                  "source": r.source,
                  "review": r.review,
-                 "review_vec": self._embed_text(r.review, dim=self.REVIEW_VEC_DIM)}
-                for r in reviews
-            ]
-            self._milvus_client.insert(collection_name=self._reviews.name, data=rows)
+                 "review_vec": vec}
+                for r, vec in zip(chunk, vectors)
+            ])
+
+        # only the Milvus writes are serialised; embeddings above run in parallel across callers
+        with self._lock:
+            for rows in batches:
+                self._milvus_client.insert(collection_name=self.REV_COL, data=rows)
+
+    def amazon_reviews_url(self, book_id: int, max_age_days: int) -> Optional[str]:
+        """Not stored in Milvus, so the reviews URL is always resolved afresh"""
+        return None
+
+    def save_amazon_reviews_url(self, book_id: int, url: str) -> None:
+        """Not stored in Milvus"""
+
+    def flush(self) -> None:
+        """Milvus writes are not buffered, nothing to do"""
 
     def destroy(self) -> None:
         self._milvus_client.drop_collection(self.BOOKS_COL)
         self._milvus_client.drop_collection(self.REV_COL)
 
     def sqlite2milvus(self, db_path: str) -> None:
+        asyncio.run(self.sqlite2milvus_async(db_path))
+
+    async def sqlite2milvus_async(self, db_path: str) -> None:
+        """Copy a SQLite database into Milvus, embedding batches concurrently and inserting in bulk"""
         with SQLiteRepository(db_path) as repo:
-            for book in repo.books():
-                self.save_book(book)
-            for review in repo.reviews():
-                self.save_reviews([review])
+            books, reviews = repo.books(), repo.reviews()
+
+        semaphore = asyncio.Semaphore(self.EMBED_CONCURRENCY)
+        # the async client is bound to this event loop, so it lives only as long as the migration
+        async with AsyncOpenAI(api_key=self._openai_api_key) as client:
+            async def embed(texts: list[str], dim: int) -> list[list[float]]:
+                async with semaphore:
+                    resp = await client.embeddings.create(model=self.EMBED_MODEL, input=texts, dimensions=dim)
+                return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+            book_rows, review_rows = await asyncio.gather(
+                self._embedded_rows(
+                    books, lambda b: b.title, self.TITLE_VEC_DIM, embed,
+                    lambda b, vec: {
+                        "id": b.id,
+                        "title": b.title,
+                        "title_vec": vec,
+                        "author": b.author,
+                        "url": b.url,
+                        "published_at_ts": self._epoch(b.published_at),
+                        "image_url": b.image_url,
+                        "page": b.page,
+                        "registration_count": b.registration_count,
+                    }),
+                self._embedded_rows(
+                    reviews, lambda r: r.review, self.REVIEW_VEC_DIM, embed,
+                    lambda r, vec: {
+                        "book_id": r.book_id,
+                        "source": r.source,
+                        "review": r.review,
+                        "review_vec": vec,
+                    }),
+            )
+
+        with self._lock:
+            for start in range(0, len(book_rows), self.INSERT_BATCH_SIZE):
+                self._milvus_client.upsert(collection_name=self.BOOKS_COL,
+                                           data=book_rows[start:start + self.INSERT_BATCH_SIZE])
+            for start in range(0, len(review_rows), self.INSERT_BATCH_SIZE):
+                self._milvus_client.insert(collection_name=self.REV_COL,
+                                           data=review_rows[start:start + self.INSERT_BATCH_SIZE])
+        logger.info("Migrated %d/%d books and %d/%d reviews from %s",
+                    len(book_rows), len(books), len(review_rows), len(reviews), db_path)
+
+    async def _embedded_rows(self, items: list, text_of, dim: int, embed, to_row) -> list[dict]:
+        """Embed `items` batch by batch in parallel; batches that fail are logged and skipped"""
+        chunks = [items[i:i + self.EMBED_BATCH_SIZE] for i in range(0, len(items), self.EMBED_BATCH_SIZE)]
+        results = await asyncio.gather(*(embed([text_of(x) for x in c], dim) for c in chunks),
+                                       return_exceptions=True)
+        rows = []
+        for chunk, vectors in zip(chunks, results):
+            if isinstance(vectors, BaseException):
+                logger.error("Failed to embed %d items, skipping: %s", len(chunk), vectors)
+                continue
+            rows.extend(to_row(x, vec) for x, vec in zip(chunk, vectors))
+        return rows
 
     # ------------------------ helper ------------------------------ #
     @staticmethod
@@ -313,6 +570,7 @@ class MilvusRepository:
         if isinstance(dt, datetime):
             return int(dt.replace(tzinfo=timezone.utc).timestamp())
         elif isinstance(dt, str):
-            return int(parser.parse(dt).replace(tzinfo=timezone.utc).timestamp())
+            # SQLite hands back what sqlite3's datetime adapter wrote, i.e. `datetime.isoformat(" ")`
+            return int(datetime.fromisoformat(dt).replace(tzinfo=timezone.utc).timestamp())
         else:
             raise ValueError(f"Invalid datetime type: {type(dt)}")
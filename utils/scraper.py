@@ -1,24 +1,59 @@
 import asyncio
-import json
+import os
 import re
-from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from html import unescape
 from pathlib import Path
 from random import shuffle
-from typing import Optional, Any, Union
-
-from bs4 import BeautifulSoup, ResultSet, Tag
-from dateutil import parser
-from playwright.async_api import async_playwright, Page, BrowserContext
+from typing import Optional, Any, Callable, Awaitable, TypeVar, AsyncIterator, Iterable
+from urllib.parse import urlsplit
+
+import ahocorasick
+import httpx
+import lxml.html
+import msgspec
+import orjson
+from lxml import etree
+from lxml.cssselect import CSSSelector
+from lxml.html import HtmlElement
+from playwright.async_api import async_playwright, Page, BrowserContext, Route, TimeoutError as PlaywrightTimeoutError
 from tqdm.asyncio import tqdm as tqdm_async
 
-from utils.consts import search_url, URL, author_url, review_url, external_stores_url, PLAYWRIGHT_ARGS
-from utils.helpers import keep_first_last_curly_brackets, RetryQueue, RetryItem
+from utils.consts import search_url, URL, author_url, review_url, external_stores_url, PLAYWRIGHT_ARGS, \
+    BLOCKED_RESOURCE_TYPES, BLOCKED_URL_PARTS, ALLOWED_HOSTS, AMAZON_URL, amazon_reviews_ajax_url, \
+    amazon_reviews_url
+from utils.helpers import keep_first_last_curly_brackets, keep_first_last_curly_brackets_bytes, AsyncRetryQueue, RetryItem, \
+    parse_timestamp
+from utils.httpcache import ConditionalCache
 from utils.httpclient import HttpClientAsync
 from utils.logger import get_logger
 from utils.repository import BookRepository, SQLiteRepository
 from utils.types import Book, AuthorResponse, AuthorResource, ReviewListResponse, ReviewResource, ExternalStores, Review
 
 logger = get_logger(__name__)
+retry_logger = get_logger(__name__ + ".retry_worker")
+
+T = TypeVar("T")
+
+# below this many unwanted title keywords, `any(k in title ...)` beats building an automaton
+_AUTOMATON_MIN_KEYWORDS = 8
+# bound between pipeline stages, so a fast producer waits for the stage behind it instead of piling up work
+_STAGE_QUEUE_SIZE = 64
+
+_PRE_RE = re.compile(r"<pre[^>]*>(.*?)</pre>", re.DOTALL | re.IGNORECASE)
+_PRE_RE_BYTES = re.compile(rb"<pre[^>]*>(.*?)</pre>", re.DOTALL | re.IGNORECASE)
+# Amazon: the ASIN in product / review URLs and the paging XHR's CSRF token in the (escaped) cr-state-object
+_ASIN_RE = re.compile(r"/(?:dp|gp/product|product-reviews)/([0-9A-Z]{10})")
+_AMAZON_CSRF_RE = re.compile(r'reviewsCsrfToken(?:&quot;|")\s*:\s*(?:&quot;|")([^"&]+)')
+_PAGE_RE = re.compile(r"pageNumber=\d+")
+
+# CSS → XPath translation is done once here rather than on every page
+# plain str results: "smart" strings would each keep a back-reference to their attribute node
+_BOOK_HREFS = etree.XPath('//a[starts-with(@href, "/books/")]/@href', smart_strings=False)
+_SEL_REVIEW = CSSSelector('li[data-hook="review"], div[data-hook="review"]')  # page / XHR fragment
+# title <a> and body <span> of a review block in one query, in document order
+_SEL_REVIEW_TEXT = CSSSelector('a[data-hook="review-title"], span[data-hook="review-body"]')
 
 
 class BookmeterScraper:
@@ -29,56 +64,116 @@ class BookmeterScraper:
             settings: Any,
             *,
             repo: Optional[BookRepository] = None,
+            http: Optional[HttpClientAsync] = None,
     ):
-        self._running = False
         self._settings = settings
         self._repo = repo or SQLiteRepository(f"{self._settings.save_filename}.db")
-        self._http = HttpClientAsync()
-        self._retry_queue = RetryQueue(
+        http_settings = self._settings.http
+        self._http = http or HttpClientAsync(
+            limits=httpx.Limits(
+                max_connections=http_settings.max_connections,
+                max_keepalive_connections=http_settings.max_connections,
+                keepalive_expiry=75.0,
+            ),
+            timeout=httpx.Timeout(http_settings.timeout, connect=http_settings.connect_timeout),
+            backend=http_settings.backend,
+            cache=ConditionalCache(
+                http_settings.cache_path,
+                max_entries=http_settings.cache_size,
+                max_bytes=http_settings.cache_max_mb * 1024 * 1024,
+                save_interval=http_settings.cache_save_interval,
+            ) if http_settings.cache_path else None,
+        )
+        self._retry_queue = AsyncRetryQueue(
             max_size=self._settings.retry.retry_queue_size,
             max_retry_count=self._settings.retry.max_retry_count,
             backoff_factor=self._settings.retry.backoff_factor,
         )
+        # single-flight: concurrent keyword workers hitting the same book share one fetch
+        self._inflight: dict[tuple[str, int], asyncio.Task] = {}
+        # book ids found by any keyword so far, so overlapping searches queue each id once
+        self._seen_ids: set[int] = set()
+        # books handed to the review stage; an author's other books recur across search hits
+        self._seen_books: set[int] = set()
+        self._page_pool: asyncio.Queue[Page] = asyncio.Queue()
+        # pipeline: keyword search → book ids → author resources → (book, amazon reviews) → writer
+        self._ids_q: asyncio.Queue[int] = asyncio.Queue(_STAGE_QUEUE_SIZE)
+        self._resources_q: asyncio.Queue[AuthorResource] = asyncio.Queue(_STAGE_QUEUE_SIZE)
+        self._books_q: asyncio.Queue[tuple[Book, list[Review]]] = asyncio.Queue(_STAGE_QUEUE_SIZE)
+        self._unwanted_automaton = self._keyword_automaton(self._settings.unwanted_title_keywords)
+        # lxml releases the GIL while parsing, so threads parallelise it without pickling pages to processes
+        self._cpu_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="parse")
+        # one thread owns every repo call, so commits (fsync) never block the loop and never interleave
+        self._db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
 
     # --------------------------- Public API --------------------------- #
 
     async def run(self) -> None:
         """Run the scraper asynchronously."""
 
-        search_keywords = self._settings.search_keywords
+        loop = asyncio.get_running_loop()
+        # coroutines that finish without suspending (cache hits, already-seen ids) skip the scheduler
+        loop.set_task_factory(asyncio.eager_task_factory)
+        # getaddrinfo and other default-executor work share a bounded pool
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 2),
+                                                     thread_name_prefix="default"))
+        search_keywords = list(self._settings.search_keywords)
         shuffle(search_keywords)
         logger.info("Starting scrape for keyword(s): %s", search_keywords)
         with self._repo:  # repo is synchronized context
-            async with async_playwright() as p:
+            if self._settings.skip_existing:
+                # stored books count as seen, so neither a search hit nor an author listing fetches them again
+                existing = await self._db(self._repo.existing_book_ids)
+                self._seen_ids |= existing
+                self._seen_books |= existing
+                logger.info("Skipping %d existing book(s)", len(existing))
+            async with self._http, async_playwright() as p:
                 context: BrowserContext = await p.chromium.launch_persistent_context(
                     user_data_dir=Path(self._settings.browser_user_data),
                     headless=self._settings.headless,
                     args=PLAYWRIGHT_ARGS if self._settings.headless else [],
                 )
+                await context.route("**/*", self._route)
 
                 # —— 1) Login to share cookies between tabs ——
                 first_tab: Page = await context.new_page()
                 await self._login(first_tab)
-                await first_tab.close()
-
-                # —— 2) Start async keyword workers controlled by semaphore ——
-                semaphore = asyncio.Semaphore(self._settings.max_workers)
-                tasks = [
-                    asyncio.create_task(
-                        self._keyword_worker(keyword, context, semaphore)
-                    )
-                    for keyword in search_keywords
-                ]
-
-                # —— 3) Start a retrying task ——
-                self._running = True
-                retry_task = asyncio.create_task(self._retry_worker(context))
-
-                # —— 4) Wait for all tasks to finish ——
-                await asyncio.gather(*tasks)
-                self._running = False
-                await retry_task
+                self._http.set_cookies(await context.cookies())
+
+                workers = self._settings.max_workers
+                books = self._settings.books_concurrency
+
+                # —— 1.5) Warm tabs, checked out per unit of work that really needs the browser:
+                #          one per keyword search plus one per book stage worker (Amazon reviews) ——
+                self._page_pool.put_nowait(first_tab)
+                for _ in range(workers + books - 1):
+                    self._page_pool.put_nowait(await context.new_page())
+
+                progress = tqdm_async(desc="Books saved", unit="book")
+                async with asyncio.TaskGroup() as tg:
+                    # —— 2) Start the per-book stage consumers, the single writer and the retry workers ——
+                    stages = [
+                        *(tg.create_task(self._author_stage()) for _ in range(books)),
+                        *(tg.create_task(self._review_stage()) for _ in range(books)),
+                        tg.create_task(self._writer_stage(progress)),
+                        # each retry worker sleeps until its next retry is due
+                        *(tg.create_task(self._retry_worker()) for _ in range(workers)),
+                    ]
+
+                    # —— 3) Feed the pipeline from keyword workers controlled by semaphore ——
+                    semaphore = asyncio.Semaphore(workers)
+                    await asyncio.gather(*(self._keyword_worker(keyword, semaphore) for keyword in search_keywords))
+
+                    # —— 4) Drain the stages in order, then pending retries, then stop the consumers ——
+                    for q in (self._ids_q, self._resources_q, self._books_q):
+                        await q.join()
+                    await self._retry_queue.join()
+                    for stage in stages:
+                        stage.cancel()
+                progress.close()
                 await context.close()
+            self._db_pool.shutdown(wait=True)
+        self._cpu_pool.shutdown(wait=False)
         logger.info("Scraping finished!")
 
         # --------------------------- Internals --------------------------- #
@@ -97,148 +192,177 @@ class BookmeterScraper:
             await page.wait_for_url(URL + "/home", timeout=2 * 1000)
             logger.info("Logged in!")
 
-    async def _keyword_worker(self, keyword: str, context, semaphore: asyncio.Semaphore) -> None:
+    async def _keyword_worker(self, keyword: str, semaphore: asyncio.Semaphore) -> None:
         async with semaphore:
             logger.info(f"Keyword {keyword} started...")
-            page = await context.new_page()
+            await self._process_keyword(keyword)
+
+    async def _process_keyword(self, keyword: str) -> None:
+        """Walk search result pages and hand the book ids to the author stage.
+
+        Handing over waits while the author stage is `_STAGE_QUEUE_SIZE` ids behind, so the next page
+        is searched while the books of this one are being fetched, but never far ahead of them.
+        """
+        queued = 0
+        for page_no in range(1, self._settings.max_search_pages + 1):
+            async with self._borrow_page() as page:
+                book_ids = await self._search_ids(keyword, page_no, page)
+            # ids another keyword already queued (or stored, see `run`); no await between check and update
+            book_ids -= self._seen_ids
+            self._seen_ids |= book_ids
+            for book_id in book_ids:
+                await self._ids_q.put(book_id)
+            queued += len(book_ids)
+        logger.info("Keyword %s finished, %d new book id(s) queued", keyword, queued)
+
+    # ------------------------ Pipeline stages ------------------------ #
+
+    async def _author_stage(self) -> None:
+        """Resolve queued book ids to the author's books, until cancelled."""
+        while True:
+            book_id = await self._ids_q.get()
             try:
-                await self._process_keyword(keyword, page)
+                if author_resp := await self._author(book_id):
+                    for res in author_resp.resources:
+                        if res.id not in self._seen_books:
+                            self._seen_books.add(res.id)
+                            await self._resources_q.put(res)
+            except Exception:
+                logger.exception("Author stage failed for %s", book_id)
             finally:
-                await page.close()
-
-    async def _process_keyword(self, keyword: str, page: Page) -> None:
-        """Walk search result pages → authors → books."""
-        async for page_no in tqdm_async(
-                range(1, self._settings.max_search_pages + 1),
-                desc=f"'{keyword}'",
-                total=self._settings.max_search_pages
-        ):
-            book_ids = await self._search_ids(keyword, page_no, page)
-            for book_id in book_ids:
-                if self._settings.skip_existing and self._repo.exists(book_id):
-                    logger.info(f"Skipping existing book: {book_id}")
-                    continue
-                author_resp = await self._author(book_id, page)
-                if not author_resp:
-                    continue
-                for res in author_resp.resources:
-                    book: Optional[Book] = await self._build_book(res, page)
-                    if self._wanted_book(book):
-                        self._repo.save(book)
-                        if self._settings.amazon.enable:
-                            amazon_reviews: list[Review] = await self._amazon_reviews(book_id, page)
-                            self._repo.save_reviews(amazon_reviews)
-                        logger.info(f"Saved book: [{book_id}] {book.title}")
+                self._ids_q.task_done()
+
+    async def _review_stage(self) -> None:
+        """Build queued author resources into Books and pass the wanted ones on, until cancelled."""
+        while True:
+            res = await self._resources_q.get()
+            try:
+                book: Optional[Book] = await self._build_book(res)
+                if self._wanted_book(book):
+                    amazon_reviews = await self._amazon_reviews(book.id) if self._settings.amazon.enable else []
+                    await self._books_q.put((book, amazon_reviews))
+            except Exception:
+                logger.exception("Review stage failed for %s", res.id)
+            finally:
+                self._resources_q.task_done()
+
+    async def _writer_stage(self, progress: tqdm_async) -> None:
+        """Single writer: everything queued so far, books and all their reviews, goes in one transaction."""
+        while True:
+            batch = [await self._books_q.get()]
+            while not self._books_q.empty():
+                batch.append(self._books_q.get_nowait())
+            try:
+                await self._db(self._save_batch, batch)
+                for book, _ in batch:
+                    logger.info(f"Saved book: [{book.id}] {book.title}")
+                progress.update(len(batch))
+            except Exception:
+                logger.exception("Failed to save %d book(s)", len(batch))
+            finally:
+                for _ in batch:
+                    self._books_q.task_done()
+
+    def _save_batch(self, batch: list[tuple[Book, list[Review]]]) -> None:
+        self._repo.save_many((book for book, _ in batch), reviews=[r for _, reviews in batch for r in reviews],
+                             flush=True)
 
     # ------------------------ Scraping helpers ------------------------ #
 
     async def _search_ids(self, keyword: str, page_no: int, page: Page) -> set[int]:
         url = search_url(keyword, page_no, True)
         html = await self._fetch_with_playwright(url, page, empty_on_error=True)
-        anchors: ResultSet[Tag] = BeautifulSoup(html, "html.parser").find_all("a")
-        return {
-            int(href.split("/")[-1])
-            for a in anchors
-            if (href := a.get("href", "")).startswith("/books/") and href.split("/")[-1].isdigit()
-        }
-
-    async def _author(self, book_id: int, page: Page) -> Optional[AuthorResponse]:
-        html_raw = ""
+        if not html:
+            return set()
+        return await self._parse(self._ids_from_html, html)
+
+    async def _author(self, book_id: int) -> Optional[AuthorResponse]:
+        return await self._coalesce(("author", book_id), lambda: self._fetch_author(book_id))
+
+    async def _build_book(self, author_resource: AuthorResource, *, attempt: int = 0) -> Optional[Book]:
+        return await self._coalesce(("review", author_resource.id),
+                                    lambda: self._fetch_book(author_resource, attempt=attempt))
+
+    async def _fetch_author(self, book_id: int) -> Optional[AuthorResponse]:
         try:
-            html_raw = await self._fetch_with_playwright(author_url(book_id), page, empty_on_error=False)
-            json_dict = self._json_from_html(html_raw)
-            return AuthorResponse.from_dict(json_dict)
+            return await self._fetch_json(author_url(book_id), AuthorResponse)
         except Exception:
-            logger.exception("Failed to fetch author info for: " + html_raw)
+            logger.exception("Failed to fetch author info for: %s", book_id)
             return None
 
-    async def _build_book(self, author_resource: AuthorResource, page: Page) -> Optional[Book]:
-        html_raw = ""
+    async def _fetch_book(self, author_resource: AuthorResource, *, attempt: int = 0) -> Optional[Book]:
         try:
-            html_raw = await self._fetch_with_playwright(review_url(book_id=author_resource.id), page,
-                                                         empty_on_error=False)
-            reviews_json = self._json_from_html(html_raw)
+            reviews_resp = await self._fetch_json(review_url(book_id=author_resource.id), ReviewListResponse)
             reviews: list[str] = [
                 r.content
-                for r in ReviewListResponse.from_dict(reviews_json).resources
+                for r in reviews_resp.resources
                 if self._wanted_review(r)
             ]
+        except msgspec.ValidationError:
+            # the same body would come back on every retry
+            logger.exception("Unexpected review payload for: %s", author_resource.id)
+            return None
         except Exception:
-            logger.exception(f"Failed to fetch review info for: {html_raw} , enqueuing retry queue")
-            self._retry_queue.enqueue(RetryItem(author_resource.id, 0))
+            logger.exception("Failed to fetch review info for: %s, enqueuing retry queue", author_resource.id)
+            self._retry_later(author_resource.id, attempt)
             return None
         return Book(
             id=author_resource.id,
-            title=author_resource.title,
-            author=author_resource.author.name,
-            url=URL + author_resource.path,
-            published_at=parser.parse(author_resource.published_at or "1970-01-01T00:00:00.000+09:00").astimezone(
-                timezone.utc),
+            title=author_resource.title or "",
+            author=author_resource.author.name if author_resource.author else None,
+            url=URL + (author_resource.path or f"/books/{author_resource.id}"),
+            published_at=parse_timestamp(author_resource.published_at),
             image_url=author_resource.image_url,
             page=author_resource.page,
             registration_count=author_resource.registration_count,
             reviews=reviews,
         )
 
-    async def _amazon_reviews(self, book_id: int, page: Page) -> list[Review]:
+    async def _amazon_reviews(self, book_id: int) -> list[Review]:
+        async with self._borrow_page() as page:
+            return await self._amazon_reviews_on(book_id, page)
+
+    async def _amazon_reviews_on(self, book_id: int, page: Page) -> list[Review]:
         """
         抓取 Amazon.co.jp 的评论：
         1) 用 Bookmeter API 找到商品页 URL
-        2) 在商品页查找 data-hook="see-all-reviews-link-foot" 的链接
+        2) 在商品页查找 data-hook="see-all-reviews-link-foot" 的链接（结果存库，`refresh_reviews_url_days` 天内直接复用）
         3) 跳转到完整评论页后，循环翻页抓取每条评论的 标题/星级/正文
         4) 返回 ["<标题> <星数> <正文>", ...]
         """
         try:
-            # 1) 取外部店铺列表
-            json_dict = await self._http.get_json(external_stores_url(book_id))
-            stores: ExternalStores = ExternalStores.from_dict(json_dict)
-            if not stores or not stores.resources:
-                return []
-            amazon_url = next((r.url for r in stores.resources if r.alphabet_name.lower() == "amazon"), None)
-            if not amazon_url:
-                return []
-
-            # 2) 打开商品页，找“レビューをすべて見る”链接
-            await page.goto(amazon_url, wait_until="domcontentloaded")
-            see_all = await page.query_selector('a[data-hook="see-all-reviews-link-foot"]')
-            if not see_all:
-                return []
-
-            href = await see_all.get_attribute("href")
-            if not "product-reviews" in href:
-                return []
-            # 有时候 href 是相对路径
-            reviews_url = href if href.startswith("http") else f"https://www.amazon.co.jp{href}"
-
-            reviews: list[Review] = []
-            # 3) 循环翻页抓
-            for pno in range(1, self._settings.amazon.max_review_pages + 1):
-                # 如果 reviews_url 自带 pageNumber 参数，也可以直接替换或拼接
-                url = reviews_url
-                if "pageNumber=" in url:
-                    url = re.sub(r"pageNumber=\d+", f"pageNumber={pno}", url)
-                else:
-                    url = f"{url}{"&" if "?" in url else "?"}pageNumber={pno}"
-
-                html = await self._get_html(page, url)
-                soup = BeautifulSoup(html, "html.parser")
-                blocks: list[Tag] = soup.select('li[data-hook="review"]') or []
-
-                for b in blocks:
-                    title = b.select_one('a[data-hook="review-title"]')
-                    body = b.select_one('span[data-hook="review-body"]')
-
-                    parts = []
-                    if title and title.text.strip():
-                        parts.append(title.text.strip())
-                    if body and body.text.strip():
-                        parts.append(body.text.strip())
-
-                    line = " ".join(parts)
-                    if len(line) > 10:
-                        reviews.append(Review(book_id, line, "amazon"))
-
-                if len(blocks) < 10:
+            # 1) + 2) 上次找到的评论页 URL 还新鲜就跳过商品页
+            reviews_url = await self._db(self._repo.amazon_reviews_url, book_id,
+                                         self._settings.amazon.refresh_reviews_url_days)
+            if reviews_url is None:
+                reviews_url = await self._resolve_amazon_reviews_url(book_id, page)
+                if reviews_url is None:
+                    return []
+                await self._db(self._repo.save_amazon_reviews_url, book_id, reviews_url)
+
+            # 3) 第 1 页用浏览器打开（顺便拿 ajax 接口要的 csrf 和 cookies）
+            html = await self._amazon_browser_page(page, reviews_url, 1)
+            reviews, block_count = await self._parse(self._amazon_reviews_from_html, book_id, html)
+            rest = range(2, self._settings.amazon.max_review_pages + 1)
+            if block_count < 10 or not rest:
+                return reviews
+            asin = m.group(1) if (m := _ASIN_RE.search(reviews_url)) else None
+            csrf = m.group(1) if (m := _AMAZON_CSRF_RE.search(html)) else None
+            if asin and csrf:
+                self._http.set_cookies(await page.context.cookies(AMAZON_URL))
+                # 之后的页同时走 ajax 接口，多拿的页在遇到不满 10 条的那页后丢弃
+                fragments = await asyncio.gather(*(self._amazon_ajax_page(asin, pno, csrf) for pno in rest))
+            else:
+                fragments = [None] * len(rest)
+
+            # 4) 按页序合并，ajax 失败的页再用浏览器翻
+            for pno, html in zip(rest, fragments):
+                if html is None:
+                    html = await self._amazon_browser_page(page, reviews_url, pno)
+                page_reviews, block_count = await self._parse(self._amazon_reviews_from_html, book_id, html)
+                reviews.extend(page_reviews)
+
+                if block_count < 10:
                     break
 
             return reviews
@@ -247,50 +371,168 @@ class BookmeterScraper:
             logger.exception("Failed to fetch Amazon reviews for %d", book_id)
             return []
 
-    # ------------------------ Retry machinery ------------------------ #
+    async def _resolve_amazon_reviews_url(self, book_id: int, page: Page) -> Optional[str]:
+        """Canonical product-reviews URL of `book_id` on Amazon, None if there is none.
+
+        Built straight from the ASIN when the store link carries one, else read off the product page.
+        """
+        # 1) 取外部店铺列表
+        stores = await self._http.get_json(external_stores_url(book_id), ExternalStores)
+        if not stores or not stores.resources:
+            return None
+        amazon_url = next((r.url for r in stores.resources if (r.alphabet_name or "").lower() == "amazon"), None)
+        if not amazon_url:
+            return None
+        # 商品 URL 里带 ASIN 的话，评论页 URL 可以直接拼出来，不用打开商品页
+        if m := _ASIN_RE.search(amazon_url):
+            return amazon_reviews_url(m.group(1))
+
+        # 2) 打开商品页，找“レビューをすべて見る”链接
+        await self._goto(page, amazon_url,
+                         wait_selector='a[data-hook="see-all-reviews-link-foot"], li[data-hook="review"]')
+        see_all = await page.query_selector('a[data-hook="see-all-reviews-link-foot"]')
+        if not see_all:
+            return None
+
+        href = await see_all.get_attribute("href")
+        if not href or "product-reviews" not in href:
+            return None
+        if m := _ASIN_RE.search(href):
+            return amazon_reviews_url(m.group(1))
+        # 有时候 href 是相对路径
+        return href if href.startswith("http") else f"{AMAZON_URL}{href}"
+
+    async def _amazon_browser_page(self, page: Page, reviews_url: str, page_no: int) -> str:
+        return await self._get_html(page, self._amazon_page_url(reviews_url, page_no),
+                                    wait_selector='li[data-hook="review"]', scroll=True)
+
+    async def _amazon_ajax_page(self, asin: str, page_no: int, csrf: str) -> Optional[str]:
+        """Review list fragment for `page_no` from Amazon's paging XHR, None if it can't be used."""
+        ref = f"cm_cr_getr_d_paging_btm_next_{page_no}"
+        try:
+            body = await self._http.post_form(
+                amazon_reviews_ajax_url(page_no),
+                data={
+                    "sortBy": "", "reviewerType": "all_reviews", "formatType": "", "mediaType": "",
+                    "filterByStar": "", "filterByLanguage": "", "filterByKeyword": "", "shouldAppend": "undefined",
+                    "deviceType": "desktop", "canShowIntHeader": "undefined", "reftag": ref,
+                    "pageNumber": str(page_no), "pageSize": "10", "asin": asin, "scope": f"reviewsAjax{page_no}",
+                },
+                headers={"X-Requested-With": "XMLHttpRequest", "anti-csrftoken-a2z": csrf},
+            )
+        except Exception as e:
+            logger.warning("Amazon review XHR failed for %s page %d (%s), navigating instead", asin, page_no, e)
+            return None
+        return self._amazon_ajax_html(body)
 
-    async def _retry_worker(self, context: BrowserContext) -> None:
-        """Retry worker runs in the background, retrying failed tasks until the program exits."""
-        retry_logger = get_logger(__name__ + ".retry_worker")
-        while self._running:
-            if self._retry_queue.is_empty():
-                retry_logger.info("Retry worker sleeps because retry queue is empty")
-                await asyncio.sleep(5)
+    @staticmethod
+    def _amazon_ajax_html(body: str) -> Optional[str]:
+        """Join the HTML of the `["append", selector, html]` actions in a `&&&`-separated XHR response."""
+        parts: list[str] = []
+        for chunk in body.split("&&&"):
+            try:
+                action = orjson.loads(chunk)
+            except orjson.JSONDecodeError:
                 continue
+            if isinstance(action, list) and len(action) == 3 and action[0] == "append" and isinstance(action[2], str):
+                parts.append(action[2])
+        return "".join(parts) if parts else None
+
+    @staticmethod
+    def _amazon_page_url(reviews_url: str, page_no: int) -> str:
+        # 如果 reviews_url 自带 pageNumber 参数，也可以直接替换或拼接
+        page_param = f"pageNumber={page_no}"
+        replaced, n = _PAGE_RE.subn(page_param, reviews_url, count=1)
+        if n:
+            return replaced
+        return f"{reviews_url}{'&' if '?' in reviews_url else '?'}{page_param}"
+
+    # ------------------------ Retry machinery ------------------------ #
 
-            retry_item: RetryItem = self._retry_queue.dequeue()
+    def _retry_later(self, book_id: int, attempt: int) -> None:
+        """Schedule a retry of `book_id` after `attempt` earlier retries, unless the budget is spent."""
+        if not self._retry_queue.can_retry(attempt):
+            logger.error("Giving up id=%s after %s attempts", book_id, attempt)
+            return
+        try:
+            self._retry_queue.enqueue(RetryItem(book_id, attempt))
+        except asyncio.QueueFull:
+            logger.error("Retry queue is full (%d items), dropping id=%s", len(self._retry_queue), book_id)
+
+    async def _retry_worker(self) -> None:
+        """Retry worker runs in the background, retrying due items until it is cancelled."""
+        while True:
+            retry_item: RetryItem = await self._retry_queue.dequeue()
             book_id, attempt = retry_item.id, retry_item.attempts
-            backoff: int = self._retry_queue.backoff(attempt)
-            if attempt > 1:
-                retry_logger.warning("Will retry id=%s (attempt %s) after %d s...", book_id, attempt, backoff)
-                await asyncio.sleep(backoff)
             try:
                 retry_logger.info(f"Retrying id={book_id} (attempt {attempt})")
-                page = await context.new_page()
-                if author_resp := await self._author(book_id, page):
-                    for res in author_resp.resources:
-                        book = await self._build_book(res, page)
-                        if self._wanted_book(book, self._settings.unwanted_title_keywords):
-                            self._repo.save(book)
+                if author_resp := await self._author(book_id):
+                    # the author's other books went through the stages (or their own retries) already
+                    resources = [r for r in author_resp.resources if r.id == book_id] or author_resp.resources
+                    for res in resources:
+                        book = await self._build_book(res, attempt=attempt + 1)
+                        if self._wanted_book(book):
+                            await self._db(self._repo.save, book)
                             retry_logger.info(f"Retrying [{book_id}] {book.title} succeeded (attempt {attempt})")
             except Exception:
-                if self._retry_queue.can_retry(attempt):
-                    self._retry_queue.enqueue(RetryItem(book_id, attempt + 1))
-                    retry_logger.warning("Retry %s failed for id=%s, will retry again (attempt %s)",
-                                   attempt, book_id, attempt + 1)
-                else:
-                    retry_logger.error("Giving up id=%s after %s attempts", book_id, attempt)
-        retry_logger.info(f"Retry worker finished, still has {len(self._retry_queue)} items in queue")
+                retry_logger.warning("Retry %s failed for id=%s", attempt, book_id)
+                self._retry_later(book_id, attempt + 1)
+            finally:
+                self._retry_queue.task_done()
 
     # ----------------------------- Utils ----------------------------- #
 
-    async def _fetch_with_playwright(self, url: str, page: Page, *, empty_on_error: bool = True) -> str:
+    @asynccontextmanager
+    async def _borrow_page(self) -> AsyncIterator[Page]:
+        """Check a warm tab out of the pool for one unit of work; crashed tabs are replaced."""
+        page = await self._page_pool.get()
+        try:
+            if page.is_closed():
+                page = await page.context.new_page()
+            yield page
+        finally:
+            self._page_pool.put_nowait(page)
+
+    async def _coalesce(self, key: tuple[str, int], factory: Callable[[], Awaitable[T]]) -> T:
+        """Run `factory()` once per `key` at a time; concurrent callers await the same result."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the fetch the others wait on
+        return await asyncio.shield(task)
+
+    async def _fetch_json(self, url: str, type: type[T]) -> T:
+        """JSON API response as `type`, via the pooled httpx session, through a borrowed tab only if that fails.
+
+        The browser is the fallback only for anti-bot challenge pages, which don't decode as JSON, and
+        for 401/403s: its session may have been refreshed since login, so its cookies are then re-synced.
+        Anything else (404s, schema mismatches, a host that stays down) the browser would hit just the same.
+        """
+        try:
+            return await self._http.get_json(url, type)
+        except Exception as e:
+            cause = e.__cause__ or e
+            denied = isinstance(cause, httpx.HTTPStatusError) and cause.response.status_code in (401, 403)
+            undecodable = isinstance(cause, ValueError) and not isinstance(cause, msgspec.ValidationError)
+            if not (denied or undecodable):
+                raise
+            logger.warning("httpx failed for %s (%s) – falling back to Playwright", url, cause)
+        async with self._borrow_page() as page:
+            payload = await self._get_pre_text(page, url)
+            if denied:
+                self._http.set_cookies(await page.context.cookies(URL))
+        return await self._parse(self._decode_json, payload, type)
+
+    async def _fetch_with_playwright(self, url: str, page: Page, *, empty_on_error: bool = True) -> str | bytes:
+        """Page HTML via Playwright, or the raw (undecoded) body via httpx if the browser fails."""
         try:
             return await self._get_html(page, url)
         except Exception as e:
             logger.warning("Playwright failed for %s (%s) – falling back to httpx", url, e)
             try:
-                return await self._http.get_text(url)
+                return await self._http.get_bytes(url)
             except Exception as httpx_e:
                 if empty_on_error:
                     logger.warning("Both Playwright and HttpClient failed for %s, returning empty", url)
@@ -298,33 +540,154 @@ class BookmeterScraper:
                 raise RuntimeError(f"Both Playwright and HttpClient failed for {url}") from httpx_e
 
     @staticmethod
-    def _wanted_book(book: Optional[Book], unwanted_title_keywords: Union[list[str], tuple[str, ...]] = ()) -> bool:
-        return bool(book and book.reviews and not any(keyword in book.title for keyword in unwanted_title_keywords))
+    async def _route(route: Route) -> None:
+        """Abort assets, trackers and off-site subresources; pages themselves always load."""
+        request = route.request
+        host = urlsplit(request.url).hostname or ""
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(p in request.url for p in BLOCKED_URL_PARTS):
+            await route.abort()
+        elif request.resource_type != "document" and not any(host == h or host.endswith("." + h) for h in ALLOWED_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def _wanted_book(self, book: Optional[Book]) -> bool:
+        if not (book and book.reviews):
+            return False
+        if self._unwanted_automaton is not None:
+            return next(self._unwanted_automaton.iter(book.title), None) is None
+        return not any(keyword in book.title for keyword in self._settings.unwanted_title_keywords)
+
+    @staticmethod
+    def _keyword_automaton(keywords: Iterable[str]) -> Optional[ahocorasick.Automaton]:
+        """Aho-Corasick matcher scanning a title once for all `keywords`; None when a plain loop is cheaper."""
+        keywords = [k for k in keywords if k]
+        if len(keywords) < _AUTOMATON_MIN_KEYWORDS:
+            return None
+        automaton = ahocorasick.Automaton()
+        for i, keyword in enumerate(keywords):
+            automaton.add_word(keyword, i)
+        automaton.make_automaton()
+        return automaton
 
     @staticmethod
     def _wanted_review(review: Optional[ReviewResource]) -> bool:
         return bool(review and review.content and len(review.content) > 10)
 
     @staticmethod
-    async def _get_html(page: Page, url: str) -> str:
-        response = await page.goto(url, wait_until="networkidle", timeout=60 * 1000)
+    async def _goto(page: Page, url: str, *, wait_selector: Optional[str] = None) -> None:
+        """Navigate until the DOM is ready and, if given, `wait_selector` matched (or 10s passed)."""
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=60 * 1000)
         if response and response.status >= 400:
             raise RuntimeError(f"Bad status {response.status} for {url}")
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
+        if wait_selector:
+            try:
+                await page.wait_for_selector(wait_selector, timeout=10 * 1000)
+            except PlaywrightTimeoutError:
+                # e.g. a product without reviews; parse whatever is there
+                logger.debug("%s did not show up on %s", wait_selector, url)
+
+    @classmethod
+    async def _get_html(cls, page: Page, url: str, *, wait_selector: Optional[str] = None,
+                        scroll: bool = False) -> str:
+        """Page HTML after `_goto`, scrolled to the bottom first if `scroll` (an extra browser round trip)."""
+        await cls._goto(page, url, wait_selector=wait_selector)
+        if scroll:
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
         return await page.content()
 
+    async def _parse(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a CPU-bound parser off the event loop, so one big page doesn't stall every other task."""
+        return await asyncio.get_running_loop().run_in_executor(self._cpu_pool, fn, *args)
+
+    async def _db(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a blocking repository call on the single DB thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._db_pool, fn, *args)
+
     @staticmethod
-    def _json_from_html(html: str) -> dict:
+    def _html_tree(html: str | bytes) -> Optional[HtmlElement]:
+        """Parse with lxml's forgiving HTML parser; None for documents it can't root (empty, comments only)."""
         try:
-            return json.loads(keep_first_last_curly_brackets(html))
-        except Exception:
-            soup = BeautifulSoup(html, "html.parser")
-            pre_element = soup.find("pre")
-            if not pre_element or not pre_element.text:
-                logger.warning("Unable to find <pre> element in HTML snippet: " + html)
+            return lxml.html.fromstring(html)
+        except etree.ParserError:
+            return None
+
+    @classmethod
+    def _ids_from_html(cls, html: str | bytes) -> set[int]:
+        tree = cls._html_tree(html)
+        hrefs: list[str] = _BOOK_HREFS(tree) if tree is not None else []
+        return {int(tail) for href in hrefs if (tail := href.rsplit("/", 1)[-1]).isdigit()}
+
+    @classmethod
+    def _amazon_reviews_from_html(cls, book_id: int, html: str) -> tuple[list[Review], int]:
+        """Reviews on one Amazon review page, plus the number of review blocks seen (for paging)."""
+        tree = cls._html_tree(html) if html else None
+        blocks: list[HtmlElement] = _SEL_REVIEW(tree) if tree is not None else []
+        reviews: list[Review] = []
+        for b in blocks:
+            first: dict[str, HtmlElement] = {}
+            for el in _SEL_REVIEW_TEXT(b):
+                first.setdefault(el.tag, el)
+            title, body = first.get("a"), first.get("span")
+
+            parts = []
+            if title is not None and (text := title.text_content().strip()):
+                parts.append(text)
+            if body is not None and (text := body.text_content().strip()):
+                parts.append(text)
+
+            line = " ".join(parts)
+            if len(line) > 10:
+                reviews.append(Review(book_id, line, "amazon"))
+        return reviews, len(blocks)
+
+    @classmethod
+    async def _get_pre_text(cls, page: Page, url: str) -> str:
+        """Text of the <pre> Chromium renders a JSON response into, without serialising the whole DOM."""
+        await cls._goto(page, url, wait_selector="pre")
+        return await page.evaluate("() => (document.querySelector('pre') ?? document.body)?.innerText ?? ''")
+
+    @classmethod
+    def _pre_text(cls, html: str | bytes) -> str:
+        """Unescaped text of the <pre> Chromium wraps raw JSON in, "" if there is none."""
+        # a regex finds a well-formed <pre> without any parse ...
+        if match := (_PRE_RE_BYTES if isinstance(html, bytes) else _PRE_RE).search(html):
+            text = match.group(1)
+            return unescape(text.decode("utf-8", errors="replace") if isinstance(text, bytes) else text).strip()
+        # ... lxml copes with the rest, e.g. a truncated document missing </pre>
+        tree = cls._html_tree(html)
+        pre = tree.find(".//pre") if tree is not None else None
+        return pre.text_content().strip() if pre is not None else ""
+
+    @classmethod
+    def _decode_json(cls, text: str | bytes, type: type[T]) -> T:
+        """`text` decoded as `type` in one pass; only text that isn't bare JSON is trimmed via `_json_from_html`."""
+        try:
+            return msgspec.json.decode(text, type=type, strict=False)
+        except msgspec.ValidationError:
+            raise
+        except msgspec.DecodeError:
+            return msgspec.convert(cls._json_from_html(text), type, strict=False)
+
+    @classmethod
+    def _json_from_html(cls, html: str | bytes) -> dict:
+        if isinstance(html, bytes):
+            payload = keep_first_last_curly_brackets_bytes(html)
+        else:
+            payload = keep_first_last_curly_brackets(html)
+        if not payload:
+            # no {...} anywhere, so no <pre> wrapped JSON either
+            logger.warning("No JSON object in HTML snippet: %s", html)
+            return {}
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            text = cls._pre_text(html)
+            if not text:
+                logger.warning("Unable to find <pre> element in HTML snippet: %s", html)
                 return {}
             try:
-                return json.loads(keep_first_last_curly_brackets(pre_element.text))
-            except Exception as e:
+                return orjson.loads(keep_first_last_curly_brackets(text))
+            except orjson.JSONDecodeError as e:
                 logger.warning("Unable to extract JSON payload from HTML snippet: %s", e)
                 return {}
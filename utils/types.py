@@ -2,199 +2,66 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional, List
 
-from dataclasses_json import dataclass_json
+import msgspec
 
 
-# ---------- Common ----------
-
-@dataclass_json
-@dataclass
-class Metadata:
-    sort: str = "score"
-    order: str = "desc"
-    offset: int = 0
-    previous_cursor: int = 0
-    next_cursor: int = 0
-    limit: int = 0
-    count: int = 0
-    unread_count: Optional[int] = 0
-
-
-@dataclass_json
-@dataclass
-class User:
-    id: int = 0
-    path: str = ""
-    name: str = ""
-    image: str = ""
-
+# API payloads are msgspec Structs, decoded straight from the response bytes. Only the fields the
+# crawler reads are declared (msgspec skips the rest), and all of them but ids may be null or missing:
+# Bookmeter does send nulls, and one incomplete entry must not fail the decode of the whole list.
 
 # ---------- Review ----------
 
-@dataclass_json
-@dataclass
-class Nice:
-    path: str = ""
-    count: int = 0
-    marked: bool = False
-
-
-@dataclass_json
-@dataclass
-class Netabare:
-    netabare: bool = False
-    display_content: bool = False
-    display_comment: bool = False
-    is_clicked: bool = False
-
-
-@dataclass
-class NetabareDisplaySetting:
-    should_display_icon: bool = False
-    should_gray_out_review: bool = False
-    should_display_comment: bool = False
-
-
-@dataclass_json
-@dataclass
-class CommentsResource:
+class ReviewResource(msgspec.Struct):
     id: int
-    path: str
-    content_tag: str
-    created_at: str
-    deletable: bool
-    user: User
-    nice: Nice
-
-
-@dataclass_json
-@dataclass
-class Comments:
-    path: str
-    metadata: Metadata
-    resources: List[CommentsResource]
+    content: Optional[str] = None
 
 
-@dataclass_json
-@dataclass
-class Contents:
-    image_url: Optional[str] = None
-
-
-@dataclass_json
-@dataclass
-class ReviewResource:
-    id: int
-    path: str
-    deletable: bool
-    content_tag: str
-    content: str
-    created_at: str
-    highlight: bool
-    newly: bool
-    contents: Contents
-    user: User
-    nice: Nice
-    netabare: Netabare
-    netabare_display_setting: NetabareDisplaySetting
-    comments: Comments
-
-
-@dataclass_json
-@dataclass
-class ReviewListResponse:
-    metadata: Metadata
-    resources: List[ReviewResource]
+class ReviewListResponse(msgspec.Struct):
+    resources: List[ReviewResource] = []
 
 
 # ---------- Author ----------
 
-@dataclass_json
-@dataclass
-class Role:
-    id: int = 0
-    name: str = ""
-
-
-@dataclass_json
-@dataclass
-class Author:
-    path: str = ""
+class Author(msgspec.Struct):
     id: Optional[int] = None
-    name: str = ""
-    profile: Optional[str] = None
-    awards: Optional[str] = None
+    name: Optional[str] = None
 
 
-@dataclass_json
-@dataclass
-class AuthorAndRole:
-    author: Author
-    role: Role
+class AuthorResource(msgspec.Struct):
+    id: int
+    path: Optional[str] = None
+    title: Optional[str] = None
+    image_url: Optional[str] = None
+    registration_count: Optional[int] = None
+    page: Optional[int] = None
+    published_at: Optional[str] = None
+    author: Optional[Author] = None
 
 
-@dataclass_json
-@dataclass
-class AmazonUrls:
-    outline: str = ""
-    registration: str = ""
-    wish_book: str = ""
-
-
-@dataclass_json
-@dataclass
-class AuthorResource:
-    id: int
-    path: str
-    title: str
-    image_url: str
-    registration_count: int
-    page: int
-    original: bool
-    is_advertisable: bool
-    published_at: str
-    author: Author
-    author_and_roles: List[AuthorAndRole] = ()
-    read_book_count: int = 0
-    amazon_urls: AmazonUrls = None
-
-
-@dataclass_json
-@dataclass
-class AuthorResponse:
-    metadata: Metadata
-    title: str
-    more_path: Optional[str]
-    resources: List[AuthorResource]
+class AuthorResponse(msgspec.Struct):
+    resources: List[AuthorResource] = []
 
 
 # ---------- External Stores ----------
-@dataclass_json
-@dataclass
-class ExternalStoreResource:
-    id: int
-    book_id: int
-    url: str
-    alphabet_name: str = ""
-    official_name: str = ""
-    image_path: str = ""
+class ExternalStoreResource(msgspec.Struct):
+    url: Optional[str] = None
+    alphabet_name: Optional[str] = None
 
 
-@dataclass_json
-@dataclass
-class ExternalStores:
-    resources: List[ExternalStoreResource] = ()
+class ExternalStores(msgspec.Struct):
+    resources: List[ExternalStoreResource] = []
 
 
 # ---------- Book ----------
-@dataclass
+# slotted: thousands of these are alive at once during a crawl
+@dataclass(slots=True)
 class Review:
     book_id: int
     review: str = ""
     source: str = "bookmeter"
 
 
-@dataclass
+@dataclass(slots=True)
 class Book:
     id: int
     title: str